@@ -0,0 +1,211 @@
+'''
+Solver backends of the puzzles
+
+The gurobi backend is gurobipy itself. The cpsat backend wraps an OR-Tools CpModel in the part of the gurobipy
+Model interface the puzzles use: addVar, addVars, addConstr, addConstrs, addGenConstrIndicator, addGenConstrAnd,
+addGenConstrOr, setObjective, setParam, optimize, terminate, getVars, getAttr and setAttr for X, LB, UB, Start and
+VarHintVal, remove, and the Status and Runtime attributes. Puzzles build their models through this interface and sum with quicksum
+from here, so the same strategy runs on both.
+'''
+import itertools
+import threading
+import gurobipy as gp
+from gurobipy import GRB
+try:
+    from ortools.sat.python import cp_model
+except ImportError:
+    cp_model = None
+
+BACKENDS = ['gurobi', 'cpsat']
+local = threading.local()
+
+def make_model(backend:str, name:str, env=None):
+    '''
+    Example:
+        >>> make_model('cpsat', 'Sudoku')
+    Args:
+        backend: str, one of BACKENDS
+        name: str, the name of the model
+        env: gurobipy Env of the model, the Env of the thread from thread_env() by default, ignored by cpsat
+    Returns:
+        model: a gurobipy Model or a CpSat facade
+    '''
+    if backend == 'gurobi':
+        return gp.Model(name, env=env or getattr(local, 'env', None))
+    if backend == 'cpsat':
+        if cp_model is None:
+            raise ImportError('The cpsat backend needs ortools')
+        return CpSat(name)
+    raise ValueError(f'Unknown backend {backend}, expect one of {BACKENDS}')
+
+def thread_env():
+    '''
+    A gurobipy Env of the calling thread, threads building and solving models concurrently must not share one.
+    Later models of the thread are made in it.
+    '''
+    if getattr(local, 'env', None) is None:
+        local.env = gp.Env(empty=True)
+        local.env.setParam('OutputFlag', 0)
+        local.env.start()
+    return local.env
+
+def quicksum(terms):
+    '''
+    Sum terms of either backend, gp.quicksum does not take CP-SAT variables
+    '''
+    terms = list(terms)
+    if cp_model is not None and any(isinstance(t, cp_model.LinearExpr) for t in terms):
+        return cp_model.LinearExpr.Sum(terms)
+    return gp.quicksum(terms)
+
+class CpSat():
+    '''
+    A CP-SAT model behind the gurobipy Model interface, statuses are reported as GRB codes
+    '''
+    param_names = {'Threads': 'num_workers', 'TimeLimit': 'max_time_in_seconds', 'Seed': 'random_seed',
+                   'OutputFlag': 'log_search_progress'}
+
+    def __init__(self, name):
+        self.ModelName = name
+        self.model = cp_model.CpModel()
+        self.solver = None
+        self.parameters = {}
+        self.variables = []
+        self.constrs = 0
+        self.off = None
+        self.found = False
+        self.Status = GRB.LOADED
+        self.Runtime = 0.0
+
+    def addVar(self, lb=0.0, ub=GRB.INFINITY, obj=0.0, vtype=GRB.CONTINUOUS, name=''):
+        if vtype == GRB.BINARY:
+            var = self.model.NewBoolVar(name)
+        elif vtype == GRB.INTEGER:
+            if ub >= GRB.INFINITY or lb <= -GRB.INFINITY:
+                raise ValueError(f'CP-SAT needs bounded variables, got {name} in [{lb}, {ub}]')
+            var = self.model.NewIntVar(int(lb), int(ub), name)
+        else:
+            raise ValueError('CP-SAT has no continuous variables')
+        self.variables.append(var)
+        return var
+
+    def addVars(self, *indices, lb=0.0, ub=GRB.INFINITY, obj=0.0, vtype=GRB.CONTINUOUS, name=''):
+        lists = [range(x) if isinstance(x, int) else list(x) for x in indices]
+        if len(lists) == 1:
+            keys = lists[0]
+        else:
+            keys = [sum((k if isinstance(k, tuple) else (k,) for k in key), ()) for key in itertools.product(*lists)]
+        return gp.tupledict({k: self.addVar(lb, ub, obj, vtype, f'{name}[{k}]') for k in keys})
+
+    def addConstr(self, constr, name=''):
+        self.constrs += 1
+        return self.model.Add(constr)
+
+    def addConstrs(self, constrs, name=''):
+        return [self.addConstr(constr) for constr in constrs]
+
+    def addGenConstrIndicator(self, binvar, binval, lhs, sense=None, rhs=None, name=''):
+        if sense is not None:
+            lhs = lhs <= rhs if sense == GRB.LESS_EQUAL else lhs >= rhs if sense == GRB.GREATER_EQUAL else lhs == rhs
+        constr = self.addConstr(lhs)
+        constr.OnlyEnforceIf(binvar if binval else binvar.Not())
+        return constr
+
+    def addGenConstrAnd(self, resvar, vars, name=''):
+        vars = list(vars)
+        if not vars:
+            return [self.addConstr(resvar == 1)]
+        self.constrs += 2
+        constrs = [self.model.AddBoolAnd(vars), self.model.AddBoolOr([v.Not() for v in vars] + [resvar])]
+        constrs[0].OnlyEnforceIf(resvar)
+        return constrs
+
+    def addGenConstrOr(self, resvar, vars, name=''):
+        vars = list(vars)
+        if not vars:
+            return [self.addConstr(resvar == 0)]
+        self.constrs += 2
+        constrs = [self.model.AddBoolOr(vars), self.model.AddBoolAnd([v.Not() for v in vars])]
+        constrs[0].OnlyEnforceIf(resvar)
+        constrs[1].OnlyEnforceIf(resvar.Not())
+        return constrs
+
+    def setObjective(self, expr, sense=GRB.MINIMIZE):
+        if sense == GRB.MINIMIZE:
+            self.model.Minimize(expr)
+        else:
+            self.model.Maximize(expr)
+
+    def setParam(self, name, value):
+        if name not in self.param_names:
+            raise ValueError(f'Unknown parameter {name} for CP-SAT, expect one of {list(self.param_names)}')
+        self.parameters[name] = value
+
+    def resetParams(self):
+        self.parameters = {}
+
+    def optimize(self):
+        self.solver = cp_model.CpSolver()
+        for name, value in self.parameters.items():
+            field = self.param_names[name]
+            setattr(self.solver.parameters, field, type(getattr(self.solver.parameters, field))(value))
+        status = self.solver.Solve(self.model)
+        if status == cp_model.MODEL_INVALID:
+            raise ValueError(f'Invalid CP-SAT model: {self.model.Validate()}')
+        self.Runtime = self.solver.WallTime()
+        self.found = status in [cp_model.OPTIMAL, cp_model.FEASIBLE]
+        self.Status = {cp_model.OPTIMAL: GRB.OPTIMAL, cp_model.INFEASIBLE: GRB.INFEASIBLE}.get(status, GRB.TIME_LIMIT)
+
+    def terminate(self):
+        if self.solver is not None:
+            self.solver.StopSearch()
+
+    def update(self):
+        pass
+
+    def dispose(self):
+        pass
+
+    def getVars(self):
+        return list(self.variables)
+
+    def getAttr(self, name, objs=None):
+        if objs is not None:
+            if name != 'X':
+                raise AttributeError(f'Unknown variable attribute {name} for CP-SAT')
+            if not self.found:
+                raise ValueError('Unable to retrieve attribute X, no solution found')
+            return [self.solver.Value(v) for v in objs]
+        attrs = {'NumVars': lambda: len(self.variables), 'NumConstrs': lambda: self.constrs, 'Runtime': lambda: self.Runtime,
+                 'NodeCount': lambda: self.solver.NumBranches(), 'SolCount': lambda: int(self.found),
+                 'ObjVal': lambda: self.solver.ObjectiveValue()}
+        if name not in attrs:
+            raise AttributeError(f'Unknown model attribute {name} for CP-SAT')
+        return attrs[name]()
+
+    def setAttr(self, name, objs, values):
+        if name in ['Start', 'VarHintVal']:
+            self.model.ClearHints()
+            for v, x in zip(objs, values):
+                self.model.AddHint(v, round(x))
+        elif name == 'LB':
+            for v, x in zip(objs, values):
+                self.addConstr(v >= int(x))
+        elif name == 'UB':
+            for v, x in zip(objs, values):
+                self.addConstr(v <= int(x))
+        else:
+            raise AttributeError(f'Unknown variable attribute {name} for CP-SAT')
+
+    def remove(self, items):
+        '''
+        CP-SAT cannot delete constraints, so they are switched off by a literal fixed to false, variables are kept
+        '''
+        if self.off is None:
+            self.off = self.model.NewBoolVar('off')
+            self.model.Add(self.off == 0)
+        for item in items if isinstance(items, (list, tuple)) else [items]:
+            if isinstance(item, cp_model.Constraint):
+                item.OnlyEnforceIf(self.off)
+            elif isinstance(item, list):
+                self.remove(item)
@@ -0,0 +1,82 @@
+import os
+import glob
+import json
+import time
+from multiprocessing import Pool
+from scheduler import install, current
+
+def collect(source:str):
+    '''
+    Collect the puzzle files of a batch
+    Example:
+        >>> collect('example')
+        ['example/blank.txt', 'example/colorskyscrapers.txt', ...]
+        >>> collect('example/sudoku*.txt')
+        ['example/sudoku.txt', 'example/sudoku6.txt']
+    Args:
+        source: str, a directory or a glob pattern
+    Returns:
+        inputs: list, the paths of the puzzle files
+    '''
+    if os.path.isdir(source):
+        source = os.path.join(source, '*')
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+def tasks(file:str):
+    '''
+    Read a task list with one online task per line
+    Args:
+        file: str, the path of the task list
+    Returns:
+        inputs: list, the tasks of the puzzles
+    '''
+    with open(file, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def solve_one(job):
+    '''
+    Solve a single puzzle of a batch, used as the worker of the pool
+    Args:
+        job: tuple, (solver_class, input, kwargs) where kwargs are passed to the solver
+    Returns:
+        record: dict, the input, result, status and timings of the puzzle
+    '''
+    solver_class, input, kwargs = job
+    start = time.perf_counter()
+    try:
+        solver = solver_class(input, **kwargs)
+        record = {'input': input, 'result': str(solver), 'status': solver.status()}
+        if kwargs.get('check'):
+            record['unique'] = solver.unique
+        if kwargs.get('profile'):
+            record['stats'] = solver.stats
+        if solver.cached:
+            record['cached'] = True
+        elif not solver.native:
+            record['runtime'] = solver.model.Runtime
+    except Exception as e:
+        record = {'input': input, 'result': '', 'status': f'Error: {e}'}
+    record['time'] = time.perf_counter() - start
+    return record
+
+def run(solver_class, inputs, output, workers=None, **kwargs):
+    '''
+    Solve a batch of puzzles on a process pool and stream the records as JSONL
+    Records are written in completion order, not in input order, the workers share the core budget of the scheduler
+    Args:
+        solver_class: type, the Puzzle subclass to solve with
+        inputs: list, the files or tasks of the puzzles
+        output: file, the stream to write the records to
+        workers: int, the number of worker processes, default os.cpu_count()
+        kwargs: passed to the solver, e.g. strategy, check, params
+    Returns:
+        count: int, the number of solved puzzles
+    '''
+    count = 0
+    jobs = [(solver_class, input, kwargs) for input in inputs]
+    with Pool(workers, initializer=install, initargs=(current(),)) as pool:
+        for record in pool.imap_unordered(solve_one, jobs):
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            count += record['status'] == 'solved'
+    return count
@@ -0,0 +1,441 @@
+import sys
+import json
+import time
+import random
+import collections
+from argparse import ArgumentParser
+from sudoku import Sudoku, Diagonal
+from skyscrapers import Skyscrapers, Color
+from nonograms import Nonograms
+from minesweeper import Mosaic, MineSweeper
+from nurikabe import Nurikabe
+from puzzle import Puzzle
+from backend import BACKENDS
+from codec import decode, encode, flags
+
+VERSION = 1
+PHASES = ['parse', 'build', 'optimize', 'check']
+PUZZLES = {'sudoku': Sudoku, 'diagonal': Diagonal, 'skyscrapers': Skyscrapers, 'color': Color, 'nonograms': Nonograms,
+           'minesweeper': MineSweeper, 'mosaic': Mosaic, 'nurikabe': Nurikabe}
+
+def fill(rng, puzzle):
+    '''
+    A random solution of the blank board, by backtracking on the cell with the fewest candidates
+    '''
+    n = puzzle.n
+    used = set()
+    grid = {}
+
+    def candidates(i, j):
+        return [k for k in range(1, n+1) if not any(c in used for c in puzzle.cover(i, j, k))]
+
+    def search():
+        free = [(i, j) for i in range(n) for j in range(n) if (i, j) not in grid]
+        if not free:
+            return True
+        cell = min(free, key=lambda c: len(candidates(*c)))
+        digits = candidates(*cell)
+        rng.shuffle(digits)
+        for k in digits:
+            cover = puzzle.cover(*cell, k)
+            used.update(cover)
+            grid[cell] = k
+            if search():
+                return True
+            used.difference_update(cover)
+            del grid[cell]
+        return False
+
+    search()
+    return [[grid[i, j] for j in range(n)] for i in range(n)]
+
+def pattern(rng, puzzle):
+    '''
+    A random Sudoku solution from the shifted pattern, with the digits, the bands, the stacks and the lines
+    within them shuffled, much faster than fill for the large boxes
+    '''
+    n = puzzle.n
+    x, y = puzzle.xy()
+    digits = list(range(1, n+1))
+    rng.shuffle(digits)
+    def lines(size):
+        groups = [list(range(b, b + size)) for b in range(0, n, size)]
+        rng.shuffle(groups)
+        for group in groups:
+            rng.shuffle(group)
+        return [i for group in groups for i in group]
+    rows = lines(y)
+    cols = lines(x)
+    return [[digits[(x * (r % y) + r // y + c) % n] for c in cols] for r in rows]
+
+def sudoku(rng, solver_class, n, fill_rate):
+    '''
+    A Sudoku task with about fill_rate of the cells given, not necessarily unique
+    '''
+    puzzle = solver_class(encode([0] * n * n), solve=False)
+    if solver_class is Sudoku:
+        grid = pattern(rng, puzzle)
+    else:
+        grid = fill(rng, puzzle)
+    return encode([v if rng.random() < fill_rate else 0 for row in grid for v in row])
+
+def skyline(line):
+    res = 0
+    top = 0
+    for v in line:
+        if v > top:
+            res += 1
+            top = v
+    return res
+
+def skyscrapers(rng, n, hide):
+    '''
+    A Skyscrapers task from a random latin square with a fraction hide of the clues removed
+    '''
+    rows = list(range(n))
+    cols = list(range(n))
+    rng.shuffle(rows)
+    rng.shuffle(cols)
+    grid = [[(rows[i] + cols[j]) % n + 1 for j in range(n)] for i in range(n)]
+    columns = [[grid[i][j] for i in range(n)] for j in range(n)]
+    clues = [skyline(c) for c in columns] + [skyline(c[::-1]) for c in columns]
+    clues += [skyline(r) for r in grid] + [skyline(r[::-1]) for r in grid]
+    return '/'.join('' if rng.random() < hide else str(c) for c in clues)
+
+def runs(line):
+    res = []
+    cnt = 0
+    for v in line + [0]:
+        if v:
+            cnt += 1
+        elif cnt:
+            res.append(cnt)
+            cnt = 0
+    return res or [0]
+
+def nonograms(rng, n, density):
+    '''
+    A Nonograms task from a random image, columns first as online
+    '''
+    grid = [[int(rng.random() < density) for _ in range(n)] for _ in range(n)]
+    lines = [[grid[i][j] for i in range(n)] for j in range(n)] + grid
+    return '/'.join('.'.join(map(str, runs(line))) for line in lines)
+
+def mosaic(rng, n, density, show, safe):
+    '''
+    A Mosaic task, or a Minesweeper task if safe, showing a fraction show of the clues
+    '''
+    mines = [[int(rng.random() < density) for _ in range(n)] for _ in range(n)]
+    values = []
+    for i in range(n):
+        for j in range(n):
+            cnt = sum(mines[x][y] for x in range(max(i-1, 0), min(i+2, n)) for y in range(max(j-1, 0), min(j+2, n)))
+            values.append(cnt if rng.random() < show and not (safe and mines[i][j]) else -1)
+    return encode(values, blank=-1, separate=False)
+
+def nurikabe(rng, n, cap):
+    '''
+    A Nurikabe task grown from an all-wall board, opening cells of 2x2 walls while the walls stay connected
+    '''
+    def neighbors(x, y):
+        return [(x+dx, y+dy) for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0)] if 0 <= x+dx < n and 0 <= y+dy < n]
+
+    def component(wall, start, value):
+        seen = {start}
+        stack = [start]
+        while stack:
+            for q in neighbors(*stack.pop()):
+                if q not in seen and wall[q] == value:
+                    seen.add(q)
+                    stack.append(q)
+        return seen
+
+    def blocked(wall, c):
+        x, y = c
+        return any(all(wall.get((x+a+dx, y+b+dy), 0) for a in range(2) for b in range(2))
+                   for dx in (-1, 0) for dy in (-1, 0))
+
+    cells = [(i, j) for i in range(n) for j in range(n)]
+    while True:
+        wall = {c: 1 for c in cells}
+        progress = True
+        while progress:
+            progress = False
+            rng.shuffle(cells)
+            for c in cells:
+                if not wall[c] or not blocked(wall, c):
+                    continue
+                wall[c] = 0
+                walls = [q for q in neighbors(*c) if wall[q]]
+                if len(component(wall, c, 0)) > cap or not walls or \
+                        len(component(wall, walls[0], 1)) != sum(wall.values()):
+                    wall[c] = 1
+                    continue
+                progress = True
+        if not any(blocked(wall, c) for c in cells if wall[c]):
+            break
+    clues = {}
+    for c in sorted(cells):
+        if not wall[c] and not any(c in island for island in clues.values()):
+            island = component(wall, c, 0)
+            clues[rng.choice(sorted(island))] = island
+    return encode([len(clues[c]) if c in clues else 0 for c in sorted(cells)])
+
+def levels():
+    '''
+    The corpus levels, following the --diff levels of the parsers
+    Returns:
+        levels: list, (puzzle, level, generator) where generator maps a random.Random to an input
+    '''
+    res = []
+    for n, fill in [(6, 0.45), (9, 0.4), (12, 0.45), (16, 0.5)]:
+        res.append(('sudoku', f'{n}x{n}', lambda rng, n=n, fill=fill: sudoku(rng, Sudoku, n, fill)))
+    for n, fill in [(6, 0.45), (9, 0.35)]:
+        res.append(('diagonal', f'{n}x{n}', lambda rng, n=n, fill=fill: sudoku(rng, Diagonal, n, fill)))
+    for n in [4, 5, 6]:
+        for diff, hide in [('easy', 0.2), ('normal', 0.4), ('hard', 0.6)]:
+            res.append(('skyscrapers', f'{n}x{n} {diff}', lambda rng, n=n, hide=hide: skyscrapers(rng, n, hide)))
+    res.append(('color', '7x7', lambda rng: 'example/colorskyscrapers.txt'))
+    for n in [5, 10, 15, 20, 25]:
+        res.append(('nonograms', f'{n}x{n}', lambda rng, n=n: nonograms(rng, n, 0.6)))
+    for n in [5, 7, 10, 15, 20]:
+        for diff, show in [('easy', 0.8), ('hard', 0.5)]:
+            res.append(('minesweeper', f'{n}x{n} {diff}', lambda rng, n=n, show=show: mosaic(rng, n, 0.2, show, True)))
+            res.append(('mosaic', f'{n}x{n} {diff}', lambda rng, n=n, show=show: mosaic(rng, n, 0.5, show, False)))
+    for n in [5, 7, 10, 12, 15, 20]:
+        res.append(('nurikabe', f'{n}x{n}', lambda rng, n=n: nurikabe(rng, n, max(3, n // 2))))
+    return res
+
+def generate(seed=0, count=3):
+    '''
+    Generate the benchmark corpus, deterministic in seed and VERSION
+    Args:
+        seed: int, the seed of the generators
+        count: int, the number of puzzles per level
+    Returns:
+        corpus: list, the records {version, puzzle, level, index, input}
+    '''
+    corpus = []
+    for puzzle, level, generator in levels():
+        for index in range(1 if puzzle == 'color' else count):
+            rng = random.Random(f'{seed}/{puzzle}/{level}/{index}')
+            corpus.append({'version': VERSION, 'puzzle': puzzle, 'level': level, 'index': index, 'input': generator(rng)})
+    return corpus
+
+def strategies(solver_class):
+    return list(solver_class.strategy_bank(solver_class.__new__(solver_class)).keys())
+
+def run_one(entry, strategy, check='inplace', params=None, backend='gurobi', warm=False):
+    '''
+    Solve a corpus entry and time its phases
+    Args:
+        warm: bool, solve the entry again from its solution as a MIP start and record the node counts of both solves
+    Returns:
+        record: dict, the entry with the strategy, status and the seconds of every phase
+    '''
+    record = {k: entry[k] for k in ['version', 'puzzle', 'level', 'index']}
+    record['strategy'] = strategy
+    record['backend'] = backend
+    start = time.perf_counter()
+    try:
+        solver = PUZZLES[entry['puzzle']](entry['input'], check=check, strategy=strategy, params=params, backend=backend)
+        record['status'] = solver.status()
+        record['features'] = solver.features()
+        if check:
+            record['unique'] = solver.unique.split('\n')[0]
+        record.update({phase: solver.timings.get(phase, 0) for phase in PHASES})
+        record['stats'] = {k: v for k, v in solver.stats.items() if k != 'timings'}
+        if warm and record['status'] == 'solved' and not solver.native:
+            again = PUZZLES[entry['puzzle']](entry['input'], strategy=strategy, params=params, backend=backend, warm=solver.solution_array())
+            record['warm'] = {'nodes': solver.stats.get('NodeCount'), 'warm_nodes': again.stats.get('NodeCount'),
+                              'optimize': solver.timings.get('optimize', 0), 'warm_optimize': again.timings.get('optimize', 0)}
+    except Exception as e:
+        record['status'] = f'Error: {e}'
+    record['total'] = time.perf_counter() - start
+    return record
+
+def run(corpus, output, puzzles=None, check='inplace', params=None, backend='gurobi', warm=False, names=None):
+    '''
+    Run every strategy of every puzzle of the corpus and stream the records as JSONL
+    Args:
+        corpus: list, the corpus records
+        output: file, where the records are written
+        puzzles: list, the puzzles to run, all if None
+        names: list, the strategies to run where the puzzle has them, auto and portfolio included, the bank if None
+    Returns:
+        warmed: dict, the node counts and optimize seconds summed over the warm records
+    '''
+    warmed = {'nodes': 0, 'warm_nodes': 0, 'optimize': 0, 'warm_optimize': 0}
+    for entry in corpus:
+        if puzzles and entry['puzzle'] not in puzzles:
+            continue
+        bank = strategies(PUZZLES[entry['puzzle']])
+        for strategy in [s for s in names if s in bank + ['auto', 'portfolio']] if names else bank:
+            record = run_one(entry, strategy, check, params, backend, warm)
+            for k, v in record.get('warm', {}).items():
+                warmed[k] += v or 0
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+    return warmed
+
+def load(file):
+    with open(file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(old, new, threshold=1.25, floor=0.05):
+    '''
+    Compare two runs on the common (puzzle, level, index, strategy) keys
+    Args:
+        old, new: list, the records of the runs
+        threshold: float, the ratio of new to old time flagged as a regression
+        floor: float, differences below these seconds are noise
+    Returns:
+        regressions: list, (key, phase, old, new) for slower phases and (key, 'status', old, new) for changed status
+    '''
+    versions = set(r['version'] for r in old) | set(r['version'] for r in new)
+    if len(versions) > 1:
+        raise ValueError(f'Runs of different corpus versions: {sorted(versions)}')
+    key = lambda r: (r['puzzle'], r['level'], r['index'], r['strategy'], r.get('backend', 'gurobi'))
+    before = {key(r): r for r in old}
+    regressions = []
+    for r in new:
+        if key(r) not in before:
+            continue
+        b = before[key(r)]
+        if b['status'] != r['status']:
+            regressions.append((key(r), 'status', b['status'], r['status']))
+            continue
+        for phase in PHASES + ['total']:
+            x, y = b.get(phase, 0), r.get(phase, 0)
+            if y > x * threshold and y - x > floor:
+                regressions.append((key(r), phase, x, y))
+    return regressions
+
+def fit(records):
+    '''
+    Fit the selection table of the auto strategy: every instance solved in the records keeps its features and the
+    strategy that built and solved it fastest, the check is left out as most solves do not check
+    Args:
+        records: list, the records of one or more runs, auto and portfolio records are ignored
+    Returns:
+        tables: dict, {puzzle class: {backend: {'features': names, 'rows': [[*values, strategy]]}}}
+    '''
+    best = {}
+    seconds = lambda r: r.get('build', 0) + r.get('optimize', 0)
+    for r in records:
+        if r['strategy'] in ['auto', 'portfolio'] or r['status'] != 'solved' or 'features' not in r:
+            continue
+        key = (r['puzzle'], r['level'], r['index'], r.get('backend', 'gurobi'))
+        if key not in best or seconds(r) < seconds(best[key]):
+            best[key] = r
+    tables = {}
+    for (puzzle, level, index, backend), r in sorted(best.items()):
+        names = sorted(r['features'])
+        table = tables.setdefault(PUZZLES[puzzle].__name__, {}).setdefault(backend, {'features': names, 'rows': []})
+        table['rows'].append([r['features'][k] for k in names] + [r['strategy']])
+    return tables
+
+def codec(size=300, repeat=5, seed=0):
+    '''
+    Time the task codec on large random boards
+    Returns:
+        timings: dict, the best seconds of every operation over the repeats
+    '''
+    rng = random.Random(seed)
+    values = [rng.choice([0, 0, rng.randint(1, 35)]) for _ in range(size * size)]
+    digits = [rng.choice([-1, rng.randint(0, 9)]) for _ in range(size * size)]
+    grid = decode(encode(values)).reshape(size, size)
+    cases = {'encode': lambda: encode(values), 'decode': lambda: decode(task),
+             'encode digits': lambda: encode(digits, blank=-1, separate=False), 'decode digits': lambda: decode(short, digits=1, blank=-1),
+             'flags': lambda: flags(grid)}
+    task, short = encode(values), encode(digits, blank=-1, separate=False)
+    if decode(task).tolist() != values or decode(short, digits=1, blank=-1).tolist() != digits:
+        raise ValueError('The codec does not round trip')
+    timings = {}
+    for name, case in cases.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+    return timings
+
+class BenchParser(ArgumentParser):
+    def __init__(self, description='Puzzle Benchmark'):
+        super().__init__(description=description)
+        commands = self.add_subparsers(dest='command', required=True, parser_class=ArgumentParser)
+        parser = commands.add_parser('generate', help='Generate the corpus')
+        parser.add_argument('-o', '--output', type=str, default='example/bench.jsonl', help='File to save the corpus')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generators')
+        parser.add_argument('--count', type=int, default=3, help='Number of puzzles per level')
+        parser = commands.add_parser('run', help='Run the corpus')
+        parser.add_argument('--corpus', type=str, default='example/bench.jsonl', help='File of the corpus')
+        parser.add_argument('-o', '--output', type=str, help='File to save the records')
+        parser.add_argument('--puzzle', type=str, nargs='*', choices=PUZZLES.keys(), help='Puzzles to run, all by default')
+        parser.add_argument('--check', nargs='?', const='inplace', default='inplace', choices=['inplace', 'clone', 'pool', 'none'], help='How check_unique is timed, none to skip it')
+        parser.add_argument('--backend', type=str, default='gurobi', choices=BACKENDS, help='Solver of the models')
+        parser.add_argument('--threads', type=int, default=1, help='Number of solver threads')
+        parser.add_argument('--timeout', type=float, help='Time limit of every solve in seconds')
+        parser.add_argument('--warm', action='store_true', help='Solve every entry again from its solution and report the node counts')
+        parser.add_argument('--strategy', type=str, nargs='*', help='Strategies to run, auto and portfolio included, the whole bank by default')
+        parser = commands.add_parser('fit', help='Fit the selection table of the auto strategy')
+        parser.add_argument('records', type=str, nargs='+', help='Records of the runs')
+        parser.add_argument('-o', '--output', type=str, default=Puzzle.selection_file, help='File to save the table')
+        parser = commands.add_parser('compare', help='Flag regressions between two runs')
+        parser.add_argument('old', type=str, help='Records of the baseline run')
+        parser.add_argument('new', type=str, help='Records of the new run')
+        parser.add_argument('--threshold', type=float, default=1.25, help='Ratio of new to old time flagged as a regression')
+        parser.add_argument('--floor', type=float, default=0.05, help='Differences below these seconds are ignored')
+        parser = commands.add_parser('codec', help='Time the task codec')
+        parser.add_argument('--size', type=int, default=300, help='Side of the random boards')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the best is reported')
+
+    def main(self):
+        self.args = self.parse_args()
+        if self.args.command == 'generate':
+            corpus = generate(self.args.seed, self.args.count)
+            with open(self.args.output, 'w') as f:
+                for entry in corpus:
+                    f.write(json.dumps(entry) + '\n')
+            print(f'{len(corpus)} puzzles of version {VERSION} saved to {self.args.output}')
+        elif self.args.command == 'run':
+            params = {'Threads': self.args.threads}
+            if self.args.timeout:
+                params['TimeLimit'] = self.args.timeout
+            check = False if self.args.check == 'none' else self.args.check
+            output = open(self.args.output, 'w') if self.args.output else sys.stdout
+            try:
+                warmed = run(load(self.args.corpus), output, self.args.puzzle, check, params, self.args.backend, self.args.warm, self.args.strategy)
+            finally:
+                if self.args.output:
+                    output.close()
+            if self.args.warm:
+                print(f"Warm start: {warmed['nodes']:.0f} -> {warmed['warm_nodes']:.0f} nodes, "
+                      f"optimize {warmed['optimize']:.3f}s -> {warmed['warm_optimize']:.3f}s", file=sys.stderr)
+        elif self.args.command == 'fit':
+            tables = fit([r for file in self.args.records for r in load(file)])
+            with open(self.args.output, 'w') as f:
+                json.dump({'version': VERSION, 'tables': tables}, f)
+            for puzzle, backends in tables.items():
+                for backend, table in backends.items():
+                    picks = collections.Counter(row[-1] for row in table['rows'])
+                    print(f'{puzzle} {backend}: ' + ', '.join(f'{s} {c}' for s, c in picks.most_common()))
+            print(f'Selection table saved to {self.args.output}')
+        elif self.args.command == 'codec':
+            for name, seconds in codec(self.args.size, self.args.repeat).items():
+                print(f'{name}: {seconds * 1000:.2f}ms for {self.args.size * self.args.size} cells')
+        else:
+            regressions = compare(load(self.args.old), load(self.args.new), self.args.threshold, self.args.floor)
+            for key, phase, old, new in regressions:
+                if phase == 'status':
+                    print(f'{" ".join(map(str, key))}: status {old} -> {new}')
+                else:
+                    print(f'{" ".join(map(str, key))}: {phase} {old:.3f}s -> {new:.3f}s')
+            print(f'{len(regressions)} regressions')
+            sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    parser = BenchParser()
+    parser.main()
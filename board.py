@@ -1,22 +1,53 @@
 import gurobipy as gp
 from gurobipy import GRB, Model
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
 
 class Board:
-    def __init__(self, n, m=0, name='Board'):
+    def __init__(self, n, m=0, name='Board', names=True, lazy=False):
         if m == 0:
             m = n
         self.n = n
         self.m = m
         self.name = name
+        self.names = names
+        self.lazy = lazy
         self.model = Model(name)
-        self.ans = self.model.addVars(n, m, vtype=GRB.BINARY, name='ans')
-        self.cnt = self.model.addVars(2, vtype=GRB.INTEGER, name='cnt')
+        self.x = self.model.addMVar((n, m), vtype=GRB.BINARY, name=self.label('ans'))
+        self.ans = self.view(self.x, (n, m))
+        self.cnt = self.model.addVars(2, vtype=GRB.INTEGER, name=self.label('cnt'))
         self.model.addConstr(self.cnt[0] == self.n * self.m - self.ans.sum())
         self.model.addConstr(self.cnt[1] == self.ans.sum())
         self.clues = {"color": {}, "size": {}}
+        self.add_edges()
         self.add_cut()
-        self.add_e()
+        if lazy:
+            self.s = {}
+            self.t = {}
+            self.connected = []
+        else:
+            self.add_e()
+
+    def label(self, name):
+        return name if self.names else ''
+
+    def view(self, mvar, shape):
+        return gp.tupledict(zip(np.ndindex(*shape), mvar.reshape(-1).tolist()))
+
+    def gather(self, index, size):
+        '''
+        Sparse matrix picking the entries index out of a vector of length size
+        '''
+        return sp.csr_matrix((np.ones(len(index)), (np.arange(len(index)), index)), shape=(len(index), size))
+
+    def add_rows(self, terms, sense, rhs):
+        '''
+        Add the rows sum(A @ x for A, x in terms) sense rhs in one addMConstr call
+        '''
+        A = sp.hstack([a for a, _ in terms], format='csr')
+        x = gp.hstack([v.reshape(-1) for _, v in terms])
+        return self.model.addMConstr(A, x, sense, np.full(A.shape[0], rhs, dtype=float))
 
     def adj(self, x, y):
         res = []
@@ -24,35 +55,51 @@ class Board:
             if 0 <= x + dx < self.n and 0 <= y + dy < self.m:
                 res.append((x + dx, y + dy))
         return res
-    
+
+    def add_edges(self):
+        '''
+        Directed edges between adjacent cells as index arrays over the flattened cells,
+        with the sparse incidence matrices of the edges leaving and entering every cell
+        '''
+        x, y = np.indices((self.n, self.m))
+        src, dst = [], []
+        for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+            ok = (0 <= x + dx) & (x + dx < self.n) & (0 <= y + dy) & (y + dy < self.m)
+            src.append((x * self.m + y)[ok])
+            dst.append(((x + dx) * self.m + y + dy)[ok])
+        self.src = np.concatenate(src)
+        self.dst = np.concatenate(dst)
+        self.edges = [(int(u // self.m), int(u % self.m), int(v // self.m), int(v % self.m)) for u, v in zip(self.src, self.dst)]
+        self.out = self.gather(self.src, self.n * self.m).T.tocsr()
+        self.inc = self.gather(self.dst, self.n * self.m).T.tocsr()
+        self.adjacency = self.out @ self.inc.T
+
     def add_cut(self):
-        self.is_cut = {}
-        for x in range(self.n):
-            for y in range(self.m):
-                for xx, yy in self.adj(x, y):
-                    self.is_cut[x, y, xx, yy] = self.model.addVar(vtype=GRB.BINARY, name=f'is_cut[{x},{y},{xx},{yy}]')
-                    self.model.addConstr(self.is_cut[x, y, xx, yy] <= self.ans[x, y] + self.ans[xx, yy])
-                    self.model.addConstr(self.is_cut[x, y, xx, yy] <= 2 - self.ans[x, y] - self.ans[xx, yy])
-                    self.model.addConstr(self.is_cut[x, y, xx, yy] >= self.ans[x, y] - self.ans[xx, yy])
-                    self.model.addConstr(self.is_cut[x, y, xx, yy] >= self.ans[xx, yy] - self.ans[x, y])
+        N, E = self.n * self.m, len(self.edges)
+        I = sp.identity(E, format='csr')
+        S = self.gather(self.src, N)
+        D = self.gather(self.dst, N)
+        self.cut = self.model.addMVar(E, vtype=GRB.BINARY, name=self.label('is_cut'))
+        self.add_rows([(I, self.cut), (-S - D, self.x)], GRB.LESS_EQUAL, 0)
+        self.add_rows([(I, self.cut), (S + D, self.x)], GRB.LESS_EQUAL, 2)
+        self.add_rows([(I, self.cut), (D - S, self.x)], GRB.GREATER_EQUAL, 0)
+        self.add_rows([(I, self.cut), (S - D, self.x)], GRB.GREATER_EQUAL, 0)
+        self.is_cut = dict(zip(self.edges, self.cut.tolist()))
 
     def add_e(self):
-        self.e = {}
         self.s = {}
         self.t = {}
-        self.sum_in = self.model.addVars(self.n, self.m, vtype=GRB.INTEGER, name=f'sum_in')
-        self.sum_out = self.model.addVars(self.n, self.m, vtype=GRB.INTEGER, name=f'sum_out')
-        for x in range(self.n):
-            for y in range(self.m):
-                for xx, yy in self.adj(x, y):
-                    self.e[x, y, xx, yy] = self.model.addVar(vtype=GRB.INTEGER, lb=0, name=f'e[{x},{y},{xx},{yy}]')
-                    self.model.addConstr((self.is_cut[x, y, xx, yy] == 1) >> (self.e[x, y, xx, yy] == 0))
-                    # self.model.addConstr((self.is_cut[x, y, xx, yy] == 0) >> (self.e[x, y, xx, yy] >= 1))
-        for x in range(self.n):
-            for y in range(self.m):
-                self.model.addConstr(self.sum_out[x, y] == gp.quicksum(self.e[x, y, xx, yy] for xx, yy in self.adj(x, y)))
-                self.model.addConstr(self.sum_in[x, y] == gp.quicksum(self.e[xx, yy, x, y] for xx, yy in self.adj(x, y)))
-    
+        N, E = self.n * self.m, len(self.edges)
+        self.flow = self.model.addMVar(E, vtype=GRB.INTEGER, lb=0, name=self.label('e'))
+        self.model.addGenConstrIndicator(self.cut, True, self.flow, GRB.EQUAL, 0)
+        self.fin = self.model.addMVar(N, vtype=GRB.INTEGER, name=self.label('sum_in'))
+        self.fout = self.model.addMVar(N, vtype=GRB.INTEGER, name=self.label('sum_out'))
+        self.add_rows([(sp.identity(N, format='csr'), self.fout), (-self.out, self.flow)], GRB.EQUAL, 0)
+        self.add_rows([(sp.identity(N, format='csr'), self.fin), (-self.inc, self.flow)], GRB.EQUAL, 0)
+        self.e = dict(zip(self.edges, self.flow.tolist()))
+        self.sum_in = self.view(self.fin, (self.n, self.m))
+        self.sum_out = self.view(self.fout, (self.n, self.m))
+
     def clue_color(self, x, y, color):
         self.clues["color"][x, y] = color
         self.model.addConstr(self.ans[x, y] == color)
@@ -62,35 +109,76 @@ class Board:
         if color != -1:
             self.clue_color(x, y, color)
 
+    def reach(self, keys):
+        '''
+        Which clue regions can reach every cell: a BFS from each clue within its size,
+        never entering another clue of the same color nor the cells next to it
+        Returns:
+            feasible: np.array, (cells, regions) booleans, region 0 covering every cell
+        '''
+        N = self.n * self.m
+        color = self.clues["color"]
+        feasible = np.zeros((N, len(keys) + 1), dtype=bool)
+        feasible[:, 0] = True
+        for i, key in enumerate(keys, 1):
+            blocked = np.zeros(N, dtype=bool)
+            for other in keys:
+                if other != key and color.get(other, -1) != -1 and color.get(other) == color.get(key):
+                    blocked[other[0] * self.m + other[1]] = True
+                    for xx, yy in self.adj(*other):
+                        blocked[xx * self.m + yy] = True
+            root = key[0] * self.m + key[1]
+            feasible[root, i] = True
+            frontier = [root]
+            for _ in range(self.clues["size"][key] - 1):
+                frontier = [v for u in frontier for v in self.adjacency[u].indices if not feasible[v, i] and not blocked[v]]
+                feasible[frontier, i] = True
+        return feasible
+
     def build_size(self):
         keys = list(self.clues["size"].keys())
-        self.is_belong = self.model.addVars(self.n, self.m, len(keys) + 1, vtype=GRB.BINARY, name="is_belong")
-        self.is_belong_and = {}
-        self.s["size"] = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name="s_size")
-        self.t["size"] = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name="t_size")
-        for x in range(self.n):
-            for y in range(self.m):
-                self.model.addConstr(gp.quicksum(self.is_belong[x, y, i] for i in range(len(keys) + 1)) == 1)
-                self.model.addConstr((self.is_belong[x, y, 0] == 1) >> (self.t["size"][x, y] == 0))
-                self.model.addConstr((self.is_belong[x, y, 0] == 0) >> (self.t["size"][x, y] == 1 - self.s["size"][x, y]))
-                self.model.addConstr((self.t["size"][x, y] == 1) >> (self.sum_out[x, y] == self.sum_in[x, y] - 1))
-                if (x, y) in self.clues["size"]:
-                    i = list(keys).index((x, y)) + 1
-                    self.model.addConstr(self.s["size"][x, y] == 1)
-                    self.model.addConstr(self.is_belong[x, y, i] == 1)
-                    self.model.addConstr(self.sum_out[x, y] == self.sum_in[x, y] + self.clues["size"][x, y] - 1)
-                    self.model.addConstr(gp.quicksum(self.is_belong[xx, yy, i] for xx in range(self.n) for yy in range(self.m)) == self.clues["size"][x, y])
-                    for xx in range(self.n):
-                        for yy in range(self.m):
-                            if abs(x - xx) + abs(y - yy) >= self.clues["size"][x, y]:
-                                self.model.addConstr(self.is_belong[xx, yy, i] == 0)
-                else:
-                    self.model.addConstr(self.s["size"][x, y] == 0)
-                for xx, yy in self.adj(x, y):
-                    for i in range(len(keys) + 1):
-                        self.is_belong_and[x, y, xx, yy, i] = self.model.addVar(vtype=GRB.BINARY, name=f'is_belong_and[{x},{y},{xx},{yy},{i}]')
-                        self.model.addConstr(self.is_belong_and[x, y, xx, yy, i] == gp.and_(self.is_belong[x, y, i], self.is_belong[xx, yy, i]))
-                    self.model.addConstr(self.is_cut[x, y, xx, yy] == 1 - gp.quicksum(self.is_belong_and[x, y, xx, yy, i] for i in range(len(keys) + 1)))
+        N, E, R = self.n * self.m, len(self.edges), len(keys) + 1
+        cells = np.array([x * self.m + y for x, y in keys], dtype=int)
+        s = np.zeros(N)
+        s[cells] = 1
+        feasible = self.reach(keys)
+        pr, pc = np.nonzero(feasible.T)
+        index = np.full((N, R), -1)
+        index[pc, pr] = np.arange(len(pc))
+        ub = np.ones(len(pc))
+        ub[cells] = 0
+        belong = self.model.addMVar(len(pc), ub=ub, vtype=GRB.BINARY, name=self.label("is_belong"))
+        self.wall = belong[:N]
+        self.add_rows([(self.gather(pc, N).T.tocsr(), belong)], GRB.EQUAL, 1)
+        if not self.lazy:
+            # the flows of the regions, the lazy board cuts them off in the callback instead
+            self.s["size"] = self.model.addMVar(N, lb=s, ub=s, vtype=GRB.BINARY, name=self.label("s_size"))
+            self.t["size"] = self.model.addMVar(N, vtype=GRB.BINARY, name=self.label("t_size"))
+            self.model.addGenConstrIndicator(self.wall, True, self.t["size"], GRB.EQUAL, 0)
+            self.model.addGenConstrIndicator(self.wall, False, self.t["size"] + self.s["size"], GRB.EQUAL, 1)
+            self.model.addGenConstrIndicator(self.t["size"], True, self.fout - self.fin, GRB.EQUAL, -1)
+        for i, (cx, cy) in enumerate(keys, 1):
+            c = cx * self.m + cy
+            size = self.clues["size"][cx, cy]
+            self.model.addConstr(belong[index[c, i]] == 1)
+            if not self.lazy:
+                self.model.addConstr(self.fout[c] == self.fin[c] + size - 1)
+            self.model.addConstr(belong[np.flatnonzero(pr == i)].sum() == size)
+        qe, qr = np.nonzero(feasible[self.src] & feasible[self.dst])
+        both = self.model.addMVar(len(qe), vtype=GRB.BINARY, name=self.label("is_belong_and"))
+        I = sp.identity(len(qe), format='csr')
+        S = self.gather(index[self.src[qe], qr], len(pc))
+        D = self.gather(index[self.dst[qe], qr], len(pc))
+        self.add_rows([(I, both), (-S, belong)], GRB.LESS_EQUAL, 0)
+        self.add_rows([(I, both), (-D, belong)], GRB.LESS_EQUAL, 0)
+        self.add_rows([(I, both), (-S - D, belong)], GRB.GREATER_EQUAL, -1)
+        self.add_rows([(sp.identity(E, format='csr'), self.cut), (self.gather(qe, E).T.tocsr(), both)], GRB.EQUAL, 1)
+        self.belong = belong
+        self.both = both
+        self.roots = cells
+        self.regions = pc, pr
+        variables = belong.tolist()
+        self.is_belong = gp.tupledict({(int(c // self.m), int(c % self.m), int(r)): variables[k] for k, (c, r) in enumerate(zip(pc, pr))})
 
     def rule_no2x2(self, color=1):
         for x in range(self.n - 1):
@@ -101,6 +189,9 @@ class Board:
                     self.model.addConstr(self.ans[x, y] + self.ans[x + 1, y] + self.ans[x, y + 1] + self.ans[x + 1, y + 1] <= 3)
 
     def rule_connected(self, color):
+        if self.lazy:
+            self.connected.append(color)
+            return
         self.s[color] = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name=f's_{color}')
         self.t[color] = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name=f't_{color}')
         self.model.addConstr(self.s[color].sum() == 1)
@@ -115,13 +206,54 @@ class Board:
                 self.model.addConstr((self.t[color][x, y] == 1) >> (self.sum_out[x, y] == self.sum_in[x, y] - 1))
 
     def rule_nurikabe(self):
-        for x in range(self.n):
-            for y in range(self.m):
-                self.model.addConstr((self.is_belong[x, y, 0] == 1) >> (self.ans[x, y] == 1))
-                self.model.addConstr((self.is_belong[x, y, 0] == 0) >> (self.ans[x, y] == 0))
+        N = self.n * self.m
+        self.add_rows([(sp.identity(N, format='csr'), self.x), (-sp.identity(N, format='csr'), self.wall)], GRB.EQUAL, 0)
     
+    def components(self, mask):
+        '''
+        Connected components of the cells in mask, as a list of arrays of flattened cells
+        '''
+        cells = np.flatnonzero(mask)
+        _, labels = connected_components(self.adjacency[cells][:, cells], directed=False)
+        return [cells[labels == k] for k in range(labels.max() + 1)] if len(cells) else []
+
+    def boundary(self, comp):
+        mask = np.asarray(self.adjacency[comp].sum(axis=0)).reshape(-1) > 0
+        mask[comp] = False
+        return np.flatnonzero(mask)
+
+    def callback(self, model, where):
+        '''
+        Lazy connectivity cuts, replacing the flow variables when the board is lazy
+        For every incumbent, a component C of a connected color or region which is cut off
+        from the rest of it gets the cut: some cell around C has that color or region
+        '''
+        if where != GRB.Callback.MIPSOL:
+            return
+        a = self.x.reshape(-1).tolist()
+        x = np.round(model.cbGetSolution(self.x)).reshape(-1)
+        for color in self.connected:
+            lit = lambda k: a[k] if color == 1 else 1 - a[k]
+            comps = self.components(x == color)
+            if len(comps) > 1:
+                for comp, other in zip(comps, comps[1:] + comps[:1]):
+                    model.cbLazy(gp.quicksum(lit(k) for k in self.boundary(comp)) >= lit(comp[0]) + lit(other[0]) - 1)
+        if not hasattr(self, 'belong'):
+            return
+        pc, pr = self.regions
+        value = np.round(model.cbGetSolution(self.belong))
+        for i, root in enumerate(self.roots, 1):
+            for comp in self.components(np.isin(np.arange(self.n * self.m), pc[(pr == i) & (value > 0.5)])):
+                if root not in comp:
+                    b = lambda k: self.is_belong.get((int(k // self.m), int(k % self.m), i), 0)
+                    model.cbLazy(gp.quicksum(b(k) for k in self.boundary(comp)) >= b(comp[0]))
+
     def solve(self):
-        self.model.optimize()
+        if self.lazy:
+            self.model.setParam('LazyConstraints', 1)
+            self.model.optimize(self.callback)
+        else:
+            self.model.optimize()
 
 
 if __name__ == '__main__':
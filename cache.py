@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+class Cache():
+    '''
+    Solution cache in a SQLite file, shared between processes
+
+    Example:
+        cache = Cache('solutions.db', size=10000)
+        cache.put('Sudoku:...', [[1, 2], [2, 1]])
+        cache.get('Sudoku:...')
+
+    Args:
+        path: the database file
+        size: the maximum number of entries, the least recently used ones are evicted beyond it, 0 for no limit
+    '''
+    def __init__(self, path='solutions.db', size=100000):
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        self.pid = None
+        self.conn = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['size'])
+
+    def connect(self):
+        '''
+        A connection must not cross a fork, so every process opens its own
+        '''
+        if self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, value TEXT, used REAL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, key):
+        '''
+        Returns:
+            the cached value, or None on a miss
+        '''
+        with self.lock:
+            conn = self.connect()
+            row = conn.execute('SELECT value FROM solutions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE solutions SET used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self.lock:
+            conn = self.connect()
+            conn.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)', (key, json.dumps(value), time.time()))
+            if self.size:
+                conn.execute('DELETE FROM solutions WHERE key IN (SELECT key FROM solutions ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.size,))
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.connect().execute('DELETE FROM solutions')
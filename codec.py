@@ -0,0 +1,105 @@
+'''
+Codec of the online task format
+
+A board is sent as its cells in row-major order: numbers are written out, a letter stands for a run of empty cells
+('a' for one up to 'z' for 26) and '_' separates adjacent numbers. Parsers read up to two digits at once, puzzles
+with single digit clues such as Mosaic read one. Solutions are submitted as comma terminated numbers or y/n flags.
+'''
+import re
+import numpy as np
+
+TOKENS = {1: re.compile(r'(\d)|([a-z])|(_)|(.)', re.S), 2: re.compile(r'(\d\d?)|([a-z])|(_)|(.)', re.S)}
+RUNS = re.compile(r'[a-z]')
+
+def decode(task:str, digits=2, blank=0):
+    '''
+    Decode a task in a single pass. Any character outside digits, 'a'-'z' and '_' raises ValueError, uppercase
+    letters included, where the text parsers used to skip them
+    Example:
+        >>> decode('b3_4a12')
+        array([ 0,  0,  3,  4,  0, 12])
+    Args:
+        task: str, the encoded board
+        digits: int, the most digits read as one number, 1 or 2
+        blank: int, the value of an empty cell
+    Returns:
+        values: ndarray, the cells of the board in row-major order
+    '''
+    values = []
+    for number, run, sep, other in TOKENS[digits].findall(task):
+        if number:
+            values.append(int(number))
+        elif run:
+            values.extend([blank] * (ord(run) - ord('a') + 1))
+        elif other:
+            raise ValueError(f"Invalid character '{other}'")
+    return np.array(values, dtype=int)
+
+def encode(values, blank=0, separate=True):
+    '''
+    Encode a flat board in the online task format, runs of blanks as letters
+    Example:
+        >>> encode([0, 0, 3, 4, 0, 12])
+        'b3_4a12'
+    Args:
+        values: the cells of the board in row-major order
+        blank: int, the value of an empty cell
+        separate: bool, put '_' between adjacent numbers, the parsers reading two digits at once need it
+    Returns:
+        task: str, the encoded board
+    '''
+    res = []
+    run = 0
+    number = False
+    for v in values:
+        if v == blank:
+            run += 1
+            continue
+        while run:
+            res.append(chr(ord('a') + min(run, 26) - 1))
+            run -= min(run, 26)
+            number = False
+        if number and separate:
+            res.append('_')
+        res.append(str(v))
+        number = True
+    while run:
+        res.append(chr(ord('a') + min(run, 26) - 1))
+        run -= min(run, 26)
+    return ''.join(res)
+
+def expand(task:str, fill='.'):
+    '''
+    Expand the runs of a task into fill characters, for the parsers reading text
+    Example:
+        >>> expand('b3c1')
+        '..3...1'
+    '''
+    return RUNS.sub(lambda m: fill * (ord(m.group()) - ord('a') + 1), task)
+
+def square(values):
+    '''
+    Reshape the cells of a square board
+    Returns:
+        board: ndarray of shape (n, n)
+    '''
+    n = round(np.sqrt(len(values)))
+    if n * n != len(values):
+        raise ValueError(f'Invalid length of task: {len(values)}')
+    return np.asarray(values).reshape(n, n)
+
+def numbers(grid):
+    '''
+    Example:
+        >>> numbers(np.array([[1, 2], [2, 1]]))
+        '1,2,2,1,'
+    '''
+    return ''.join(f'{v},' for v in np.asarray(grid).ravel().tolist())
+
+def flags(grid):
+    '''
+    Example:
+        >>> flags(np.array([[1, 0], [0, 1]]))
+        'ynny'
+    '''
+    return ''.join('y' if v else 'n' for v in np.asarray(grid).ravel().tolist())
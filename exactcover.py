@@ -0,0 +1,60 @@
+def exact_cover(columns, rows, partial=(), limit=1):
+    '''
+    Solve an exact cover problem with Knuth's Algorithm X on dict-of-sets links
+    Example:
+        >>> exact_cover([1, 2, 3], {'a': [1, 2], 'b': [3], 'c': [2, 3]}, limit=2)
+        [['a', 'b']]
+    Args:
+        columns: iterable, the ids of the columns to cover exactly once
+        rows: dict, the ids of the rows mapped to the columns they cover
+        partial: iterable, the ids of the rows that must be in the solution
+        limit: int, the maximum number of solutions to search for
+    Returns:
+        solutions: list, every solution is a list of row ids
+    '''
+    X = {c: set() for c in columns}
+    for r, cols in rows.items():
+        for c in cols:
+            X[c].add(r)
+
+    def select(r):
+        removed = []
+        for j in rows[r]:
+            for i in X[j]:
+                for k in rows[i]:
+                    if k != j:
+                        X[k].remove(i)
+            removed.append(X.pop(j))
+        return removed
+
+    def deselect(r, removed):
+        for j in reversed(rows[r]):
+            X[j] = removed.pop()
+            for i in X[j]:
+                for k in rows[i]:
+                    if k != j:
+                        X[k].add(i)
+
+    def search(solution):
+        if not X:
+            solutions.append(list(solution))
+            return
+        c = min(X, key=lambda c: len(X[c]))
+        for r in list(X[c]):
+            solution.append(r)
+            removed = select(r)
+            search(solution)
+            deselect(r, removed)
+            solution.pop()
+            if len(solutions) >= limit:
+                return
+
+    solutions = []
+    solution = []
+    for r in partial:
+        if any(c not in X for c in rows[r]):
+            return solutions
+        solution.append(r)
+        select(r)
+    search(solution)
+    return solutions
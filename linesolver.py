@@ -0,0 +1,100 @@
+from functools import lru_cache
+
+def forward(clue, line):
+    '''
+    fw[k][p] is True if the first k blocks of the clue fit into line[:p]
+    '''
+    n = len(line)
+    zeros = [0] * (n + 1)
+    for p in range(n):
+        zeros[p+1] = zeros[p] + (line[p] == 0)
+    fw = [[False] * (n + 1) for _ in range(len(clue) + 1)]
+    for p in range(n + 1):
+        fw[0][p] = p == 0 or (fw[0][p-1] and line[p-1] != 1)
+    for k in range(1, len(clue) + 1):
+        l = clue[k-1]
+        for p in range(1, n + 1):
+            v = fw[k][p-1] and line[p-1] != 1
+            s = p - l
+            if not v and s >= 0 and zeros[p] == zeros[s]:
+                if k == 1:
+                    v = fw[0][s]
+                else:
+                    v = s >= 1 and line[s-1] != 1 and fw[k-1][s-1]
+            fw[k][p] = v
+    return fw, zeros
+
+def solve_line(clue, line):
+    '''
+    Intersect all placements of a nonogram clue on a partially known line
+    Example:
+        >>> solve_line([3], [-1, -1, -1, -1])
+        ([-1, 1, 1, -1], [(0, 1)])
+    Args:
+        clue: list, the block lengths, [0] for an empty line
+        line: list, the cells, -1 for unknown, 0 for empty and 1 for filled
+    Returns:
+        line: list, the deduced cells, None if no placement fits
+        bounds: list, the first and last feasible start of every block
+    '''
+    clue = [l for l in clue if l]
+    n = len(line)
+    K = len(clue)
+    fw, zeros = forward(clue, line)
+    if not fw[K][n]:
+        return None, None
+    rev, _ = forward(clue[::-1], line[::-1])
+    bw = [[rev[K-k][n-p] for p in range(n + 1)] for k in range(K + 1)]
+    fill = [0] * (n + 1)
+    bounds = []
+    for k, l in enumerate(clue):
+        first, last = n, -1
+        for s in range(n - l + 1):
+            e = s + l
+            if zeros[e] != zeros[s]:
+                continue
+            if k == 0:
+                left = fw[0][s]
+            else:
+                left = s >= 1 and line[s-1] != 1 and fw[k][s-1]
+            if k == K - 1:
+                right = bw[K][e]
+            else:
+                right = e < n and line[e] != 1 and bw[k+1][e+1]
+            if left and right:
+                fill[s] += 1
+                fill[e] -= 1
+                first = min(first, s)
+                last = max(last, s)
+        bounds.append((first, last))
+    res = []
+    cover = 0
+    for p in range(n):
+        cover += fill[p]
+        can1 = cover > 0
+        can0 = line[p] != 1 and any(fw[k][p] and bw[k][p+1] for k in range(K + 1))
+        if not can0 and not can1:
+            return None, None
+        res.append(-1 if can0 and can1 else int(can1))
+    return res, bounds
+
+@lru_cache(maxsize=1 << 16)
+def solve_bits(clue, n, ones, zeros):
+    '''
+    The line solver on a line kept as bitsets, cached as the same lines come back while probing and backtracking
+    Example:
+        >>> solve_bits((3,), 4, 0, 0)
+        (6, 0)
+    Args:
+        clue: tuple, the block lengths, (0,) for an empty line
+        n: int, the length of the line
+        ones: int, bit p set if cell p is known filled
+        zeros: int, bit p set if cell p is known empty
+    Returns:
+        bits: tuple, ones and zeros after the deduction, None if no placement fits
+    '''
+    line = [1 if ones >> p & 1 else 0 if zeros >> p & 1 else -1 for p in range(n)]
+    res, _ = solve_line(list(clue), line)
+    if res is None:
+        return None
+    return sum(1 << p for p, v in enumerate(res) if v == 1), sum(1 << p for p, v in enumerate(res) if v == 0)
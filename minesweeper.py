@@ -1,14 +1,18 @@
 import os
+import itertools
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from puzzle import Puzzle, PuzzleParser
+from backend import local, make_model, thread_env, quicksum
+from codec import decode, square, flags
+from scheduler import current
 from argparse import ArgumentParser
 from online import fetch, submit, hall
-import gurobipy as gp
 from gurobipy import GRB
 
 class Mosaic(Puzzle):
-    def __init__(self, input, name='Mosaic', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(input, name, check, solve, strategy, debug)
+    def __init__(self, input, name='Mosaic', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(input, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
 
     def init_board(self):
         self.ans = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name='ans')
@@ -23,16 +27,7 @@ class Mosaic(Puzzle):
         return self.board
 
     def parse_from_task(self, task):
-        lines = []
-        for i in range(26):
-            task = task.replace(chr(ord('a') + i), '.'*(i+1))
-        n = round(np.sqrt(len(task)))
-        if n * n != len(task):
-            raise ValueError(f'Invalid length of task: {len(task)}')
-        for i in range(n):
-            line = [int(x) if x.isdigit() else -1 for x in task[i*n:(i+1)*n]]
-            lines.append(line)
-        return self.parse(lines)
+        return self.parse(square(decode(task, digits=1, blank=-1)))
     
     def parse_from_file(self, file):
         with open(file, 'r') as f:
@@ -45,26 +40,141 @@ class Mosaic(Puzzle):
             lines.append(line)
         return self.parse(lines)
     
+    def features(self):
+        return {'size': self.n * self.m, 'clues': float(np.count_nonzero(self.board != -1)) / self.board.size}
+
+    def neighbors(self, i, j):
+        return [(i+k, j+l) for k in range(-1, 2) for l in range(-1, 2) if 0 <= i+k < self.n and 0 <= j+l < self.m]
+
+    def clues(self):
+        return [(i, j) for i in range(self.n) for j in range(self.m) if self.board[i, j] != -1]
+
+    def constrain(self, model, ans, clues):
+        for i, j in clues:
+            model.addConstr(quicksum(ans[p] for p in self.neighbors(i, j)) == self.board[i, j])
+
     def strategy_default(self):
-        for i in range(self.n):
-            for j in range(self.m):
-                if self.board[i, j] != -1:
-                    pairs = [(i+k, j+l) for k in range(-1, 2) for l in range(-1, 2) if 0 <= i+k < self.n and 0 <= j+l < self.m]
-                    self.model.addConstr(gp.quicksum(self.ans[p] for p in pairs) == self.board[i, j])
-    
+        self.constrain(self.model, self.ans, self.clues())
+
+    def components(self):
+        '''
+        Partition the clues into independent components, two clues are joined when their 3x3 neighborhoods overlap
+        Returns:
+            components: list of (cells, clues), the cells covered by a component and its clues
+            free: list of the cells touched by no clue
+        '''
+        clues = self.clues()
+        parent = {c: c for c in clues}
+        def find(c):
+            while parent[c] != c:
+                parent[c] = parent[parent[c]]
+                c = parent[c]
+            return c
+        owner = {}
+        for c in clues:
+            for p in self.neighbors(*c):
+                if p in owner:
+                    parent[find(c)] = find(owner[p])
+                else:
+                    owner[p] = c
+        groups = {}
+        for c in clues:
+            groups.setdefault(find(c), []).append(c)
+        components = []
+        for group in groups.values():
+            cells = sorted(set(p for c in group for p in self.neighbors(*c)))
+            components.append((cells, group))
+        free = [(i, j) for i in range(self.n) for j in range(self.m) if (i, j) not in owner]
+        return components, free
+
+    def solve_component(self, component, env=None):
+        '''
+        Solve one component in a model of its own
+        Returns:
+            solutions: list of dict from cell to value, two of them when checking and the component is not unique
+        '''
+        cells, clues = component
+        model = make_model(self.backend, f'{self.name} {clues[0]}', env)
+        if not self.debug:
+            model.setParam('OutputFlag', 0)
+        for key, value in self.params.items():
+            if key != 'Threads':
+                model.setParam(key, value)
+        ans = model.addVars(cells, vtype=GRB.BINARY, name='ans')
+        self.constrain(model, ans, clues)
+        solutions = []
+        for _ in range(self.limit):
+            with self.reserve(model, 1):
+                model.optimize()
+            if model.Status != GRB.OPTIMAL:
+                break
+            values = dict(zip(cells, [round(x) for x in model.getAttr('X', [ans[p] for p in cells])]))
+            solutions.append(values)
+            model.addConstr(quicksum(1 - ans[p] if values[p] else ans[p] for p in cells) >= 1)
+        model.dispose()
+        return solutions
+
+    def strategy_decompose(self):
+        '''
+        Solve every independent component of the clues in a small model, in parallel over the Threads parameter.
+        The solutions combine those of the components, cells touched by no clue are free and left empty in the first.
+        A board of a single component is solved as by the default strategy.
+        '''
+        components, free = self.components()
+        self.stats['components'] = len(components)
+        self.stats['largest'] = max([len(cells) for cells, clues in components], default=0)
+        self.stats['free'] = len(free)
+        if self.debug:
+            print(f'Components: {len(components)}, largest: {self.stats["largest"]} cells, free cells: {len(free)}')
+        if len(components) == 1 and not free:
+            return self.strategy_default()
+        self.native = True
+        workers = max(1, min(len(components), self.share or self.params.get('Threads') or current().cores))
+        envs = []
+        def solve(component):
+            if self.backend != 'gurobi' or workers == 1:
+                return self.solve_component(component)
+            if getattr(local, 'env', None) is None:
+                envs.append(thread_env())
+            return self.solve_component(component, local.env)
+        # the components are solved here, so their time is reported as optimize rather than build
+        with self.timer('optimize'):
+            try:
+                with ThreadPoolExecutor(workers) as executor:
+                    results = list(executor.map(solve, components))
+            finally:
+                for env in envs:
+                    env.dispose()
+        self.solutions = []
+        if not all(results):
+            return
+        choices = results + [[{p: 0}, {p: 1}] for p in free]
+        for combination in itertools.islice(itertools.product(*choices), self.limit):
+            grid = np.zeros((self.n, self.m), dtype=int)
+            for values in combination:
+                for p, x in values.items():
+                    grid[p] = x
+            self.solutions.append(grid)
+
+    def strategy_bank(self):
+        return {'default': self.strategy_default, 'decompose': self.strategy_decompose}
+
+    def init_nogood(self):
+        return self.nogood_binary()
+
     def init_clone(self):
         self.clone.neq = self.clone.model.addVars(self.n, self.m, vtype=GRB.BINARY, name='neq')
         for i in range(self.n):
             for j in range(self.m):
-                self.clone.model.addConstr((self.clone.neq[i, j] == 1) >> (self.clone.ans[i, j] + round(self.ans[i, j].X) == 1))
-        self.clone.model.addConstr(self.clone.neq.sum() >= 1)
+                self.clone.model.addGenConstrIndicator(self.clone.neq[i, j], True, self.clone.ans[i, j] + self.value(i, j) == 1)
+        self.clone.model.addConstr(quicksum(self.clone.neq.values()) >= 1)
     
     def pretty(self):
         try:
             res = ''
             for i in range(self.n):
                 for j in range(self.m):
-                    t = round(self.ans[i, j].X)
+                    t = self.value(i, j)
                     res += '* ' if t else '. '
                 res += '\n'
             if self.check:
@@ -77,27 +187,20 @@ class Mosaic(Puzzle):
 
     def __str__(self):
         try:
-            res = ''
-            for i in range(self.n):
-                for j in range(self.m):
-                    t = round(self.ans[i, j].X)
-                    res += 'y' if t else 'n'
-            return res
+            return flags(self.solution_array())
         except Exception as e:
             if self.debug:
                 raise e
             return f'Error: {e}'
 
 class MineSweeper(Mosaic):
-    def __init__(self, file, name='MineSweeper', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(file, name, check, solve, strategy, debug)
+    def __init__(self, file, name='MineSweeper', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(file, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
     
-    def strategy_default(self):
-        super().strategy_default()
-        for i in range(self.n):
-            for j in range(self.m):
-                if self.board[i, j] != -1:
-                    self.model.addConstr(self.ans[i, j] == 0)
+    def constrain(self, model, ans, clues):
+        super().constrain(model, ans, clues)
+        for p in clues:
+            model.addConstr(ans[p] == 0)
 
     def pretty(self):
         try:
@@ -107,7 +210,7 @@ class MineSweeper(Mosaic):
                     if self.board[i, j] >= 0:
                         res += str(self.board[i, j]) + ' '
                     else:
-                        t = round(self.ans[i, j].X)
+                        t = self.value(i, j)
                         res += '* ' if t else '. '
                 res += '\n'
             if self.check:
@@ -1,14 +1,17 @@
 import os
 import numpy as np
+from collections import deque
 from puzzle import Puzzle, PuzzleParser
+from backend import quicksum
+from linesolver import solve_line, solve_bits
+from codec import flags
 from argparse import ArgumentParser
 from online import fetch, submit, hall
-import gurobipy as gp
 from gurobipy import GRB
 
 class Nonograms(Puzzle):
-    def __init__(self, input, name='Nonograms', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(input, name, check, solve, strategy, debug)
+    def __init__(self, input, name='Nonograms', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(input, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
 
     def init_board(self):
         self.ans = self.model.addVars(self.n, self.m, vtype=GRB.BINARY, name='ans')
@@ -51,19 +54,72 @@ class Nonograms(Puzzle):
             raw = f.read()
         return self.parse(raw)
     
+    def features(self):
+        blocks = [x for d in ['row', 'col'] for line in self.board[d] for x in line if x > 0]
+        return {'size': self.n * self.m, 'blocks': len(blocks) / (self.n + self.m), 'density': sum(blocks) / (2 * self.n * self.m)}
+
+    def lines(self, d, i, grid):
+        return grid[i, :] if d == 'row' else grid[:, i]
+
+    def presolve(self):
+        '''
+        Propagate the row and column clues with the line solver until nothing changes
+        Returns:
+            grid: np.array, -1 for undetermined cells, None if some line has no placement
+            bounds: dict, the first and last feasible start of every block
+        '''
+        grid = np.full((self.n, self.m), -1, dtype=int)
+        size = {'row': self.n, 'col': self.m}
+        if any(-1 in clue for d in size for clue in self.board[d]):
+            return grid, {'row': {}, 'col': {}}
+        queue = deque((d, i) for d in size for i in range(size[d]))
+        dirty = set(queue)
+        while queue:
+            d, i = queue.popleft()
+            dirty.discard((d, i))
+            line = self.lines(d, i, grid)
+            res, _ = solve_line(self.board[d][i], line.tolist())
+            if res is None:
+                return None, None
+            for j in np.flatnonzero(line != np.array(res)):
+                line[j] = res[j]
+                other = ('col', j) if d == 'row' else ('row', j)
+                if other not in dirty:
+                    dirty.add(other)
+                    queue.append(other)
+        bounds = {'row': {}, 'col': {}}
+        for d in size:
+            for i in range(size[d]):
+                _, spans = solve_line(self.board[d][i], self.lines(d, i, grid).tolist())
+                for j, span in enumerate(spans):
+                    bounds[d][i, j] = span
+        return grid, bounds
+
     def strategy_common(self):
         self.pos = {'row': {}, 'col': {}}
+        self.span = {'row': {}, 'col': {}}
+        grid, bounds = self.presolve()
+        self.fixed = 0
+        if grid is not None:
+            cells = [(i, j) for i in range(self.n) for j in range(self.m) if grid[i, j] != -1]
+            self.fix([self.ans[c] for c in cells], [grid[c] for c in cells])
+            self.fixed = len(cells)
+        else:
+            bounds = {'row': {}, 'col': {}}
+        if self.debug:
+            print(f'Presolve: fixed {self.fixed} of {self.n * self.m} cells')
         for i in range(self.n):
             for j in range(len(self.board['row'][i])):
                 l = self.board['row'][i][j]
                 if l==-1:
                     raise NotImplementedError
                 if l==0:
-                    self.model.addConstr(gp.quicksum(self.ans[i, j] for j in range(self.m)) == 0)
+                    self.model.addConstr(quicksum(self.ans[i, j] for j in range(self.m)) == 0)
                     continue
                 pre = sum(self.board['row'][i][:j]) + j
                 suf = sum(self.board['row'][i][j+1:]) + len(self.board['row'][i]) - j - 1
-                self.pos['row'][i, j] = self.model.addVar(pre, self.m-suf-l, vtype=GRB.INTEGER, name=f'pos_row_{i}_{j}')
+                self.span['row'][i, j] = bounds['row'].get((i, j), (pre, self.m-suf-l))
+                self.pos['row'][i, j] = self.model.addVar(*self.span['row'][i, j], vtype=GRB.INTEGER, name=f'pos_row_{i}_{j}')
                 if j > 0:
                     self.model.addConstr(self.pos['row'][i, j-1] + self.board['row'][i][j-1] <= self.pos['row'][i, j] - 1)
         for i in range(self.m):
@@ -72,11 +128,12 @@ class Nonograms(Puzzle):
                 if l==-1:
                     raise NotImplementedError
                 if l==0:
-                    self.model.addConstr(gp.quicksum(self.ans[i, j] for i in range(self.n)) == 0)
+                    self.model.addConstr(quicksum(self.ans[i, j] for i in range(self.n)) == 0)
                     continue
                 pre = sum(self.board['col'][i][:j]) + j
                 suf = sum(self.board['col'][i][j+1:]) + len(self.board['col'][i]) - j - 1
-                self.pos['col'][i, j] = self.model.addVar(pre, self.n-suf-l, vtype=GRB.INTEGER, name=f'pos_col_{i}_{j}')
+                self.span['col'][i, j] = bounds['col'].get((i, j), (pre, self.n-suf-l))
+                self.pos['col'][i, j] = self.model.addVar(*self.span['col'][i, j], vtype=GRB.INTEGER, name=f'pos_col_{i}_{j}')
                 if j > 0:
                     self.model.addConstr(self.pos['col'][i, j-1] + self.board['col'][i][j-1] <= self.pos['col'][i, j] - 1)
 
@@ -96,11 +153,11 @@ class Nonograms(Puzzle):
                     self.cmpl[i, j, 'r', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmpl_{i}_{j}_r_{k}')
                     self.cmpr[i, j, 'r', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmpr_{i}_{j}_r_{k}')
                     self.cmp[i, j, 'r', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmp_{i}_{j}_r_{k}')
-                    self.model.addConstr((self.cmpl[i, j, 'r', k] == 1) >> (j >= self.pos['row'][i, k]))
-                    self.model.addConstr((self.cmpl[i, j, 'r', k] == 0) >> (j <= self.pos['row'][i, k] - 1))
-                    self.model.addConstr((self.cmpr[i, j, 'r', k] == 1) >> (j <= self.pos['row'][i, k] + l - 1))
-                    self.model.addConstr((self.cmpr[i, j, 'r', k] == 0) >> (j >= self.pos['row'][i, k] + l))
-                    self.model.addConstr(self.cmp[i, j, 'r', k] == gp.and_(self.cmpl[i, j, 'r', k], self.cmpr[i, j, 'r', k]))
+                    self.model.addGenConstrIndicator(self.cmpl[i, j, 'r', k], True, j >= self.pos['row'][i, k])
+                    self.model.addGenConstrIndicator(self.cmpl[i, j, 'r', k], False, j <= self.pos['row'][i, k] - 1)
+                    self.model.addGenConstrIndicator(self.cmpr[i, j, 'r', k], True, j <= self.pos['row'][i, k] + l - 1)
+                    self.model.addGenConstrIndicator(self.cmpr[i, j, 'r', k], False, j >= self.pos['row'][i, k] + l)
+                    self.model.addGenConstrAnd(self.cmp[i, j, 'r', k], [self.cmpl[i, j, 'r', k], self.cmpr[i, j, 'r', k]])
         for j in range(self.m):
             for k in range(len(self.board['col'][j])):
                 l = self.board['col'][j][k]
@@ -112,17 +169,17 @@ class Nonograms(Puzzle):
                     self.cmpl[i, j, 'c', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmpl_{i}_{j}_c_{k}')
                     self.cmpr[i, j, 'c', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmpr_{i}_{j}_c_{k}')
                     self.cmp[i, j, 'c', k] = self.model.addVar(vtype=GRB.BINARY, name=f'cmp_{i}_{j}_c_{k}')
-                    self.model.addConstr((self.cmpl[i, j, 'c', k] == 1) >> (i >= self.pos['col'][j, k]))
-                    self.model.addConstr((self.cmpl[i, j, 'c', k] == 0) >> (i <= self.pos['col'][j, k] - 1))
-                    self.model.addConstr((self.cmpr[i, j, 'c', k] == 1) >> (i <= self.pos['col'][j, k] + l - 1))
-                    self.model.addConstr((self.cmpr[i, j, 'c', k] == 0) >> (i >= self.pos['col'][j, k] + l))
-                    self.model.addConstr(self.cmp[i, j, 'c', k] == gp.and_(self.cmpl[i, j, 'c', k], self.cmpr[i, j, 'c', k]))
+                    self.model.addGenConstrIndicator(self.cmpl[i, j, 'c', k], True, i >= self.pos['col'][j, k])
+                    self.model.addGenConstrIndicator(self.cmpl[i, j, 'c', k], False, i <= self.pos['col'][j, k] - 1)
+                    self.model.addGenConstrIndicator(self.cmpr[i, j, 'c', k], True, i <= self.pos['col'][j, k] + l - 1)
+                    self.model.addGenConstrIndicator(self.cmpr[i, j, 'c', k], False, i >= self.pos['col'][j, k] + l)
+                    self.model.addGenConstrAnd(self.cmp[i, j, 'c', k], [self.cmpl[i, j, 'c', k], self.cmpr[i, j, 'c', k]])
         for i in range(self.n):
             for j in range(self.m):
                 if 0 not in self.board['row'][i]:
-                    self.model.addConstr(self.ans[i, j] == gp.or_(self.cmp[i, j, 'r', k] for k in range(len(self.board['row'][i]))))
+                    self.model.addGenConstrOr(self.ans[i, j], [self.cmp[i, j, 'r', k] for k in range(len(self.board['row'][i]))])
                 if 0 not in self.board['col'][j]:
-                    self.model.addConstr(self.ans[i, j] == gp.or_(self.cmp[i, j, 'c', k] for k in range(len(self.board['col'][j]))))
+                    self.model.addGenConstrOr(self.ans[i, j], [self.cmp[i, j, 'c', k] for k in range(len(self.board['col'][j]))])
                 
     def strategy_b(self):
         self.strategy_common()
@@ -134,14 +191,13 @@ class Nonograms(Puzzle):
                     raise NotImplementedError
                 if l==0:
                     continue
-                pre = sum(self.board['row'][i][:j]) + j
-                suf = sum(self.board['row'][i][j+1:]) + len(self.board['row'][i]) - j - 1
-                for k in range(pre, self.m-suf-l+1):
+                first, last = self.span['row'][i, j]
+                for k in range(first, last+1):
                     self.b['row'][i, j, k] = self.model.addVar(vtype=GRB.BINARY, name=f'b_row_{i}_{j}_{k}')
-                    self.model.addConstr((self.b['row'][i, j, k] == 1) >> (self.pos['row'][i, j] == k))
+                    self.model.addGenConstrIndicator(self.b['row'][i, j, k], True, self.pos['row'][i, j] == k)
                     for t in range(l):
-                        self.model.addConstr((self.b['row'][i, j, k] == 1) >> (self.ans[i, k+t] == 1))
-                self.model.addConstr(gp.quicksum(self.b['row'][i, j, k] for k in range(pre, self.m-suf-l+1)) == 1)
+                        self.model.addGenConstrIndicator(self.b['row'][i, j, k], True, self.ans[i, k+t] == 1)
+                self.model.addConstr(quicksum(self.b['row'][i, j, k] for k in range(first, last+1)) == 1)
         for i in range(self.m):
             for j in range(len(self.board['col'][i])):
                 l = self.board['col'][i][j]
@@ -149,43 +205,159 @@ class Nonograms(Puzzle):
                     raise NotImplementedError
                 if l==0:
                     continue
-                pre = sum(self.board['col'][i][:j]) + j
-                suf = sum(self.board['col'][i][j+1:]) + len(self.board['col'][i]) - j - 1
-                for k in range(pre, self.n-suf-l+1):
+                first, last = self.span['col'][i, j]
+                for k in range(first, last+1):
                     self.b['col'][i, j, k] = self.model.addVar(vtype=GRB.BINARY, name=f'b_col_{i}_{j}_{k}')
-                    self.model.addConstr((self.b['col'][i, j, k] == 1) >> (self.pos['col'][i, j] == k))
+                    self.model.addGenConstrIndicator(self.b['col'][i, j, k], True, self.pos['col'][i, j] == k)
                     for t in range(l):
-                        self.model.addConstr((self.b['col'][i, j, k] == 1) >> (self.ans[k+t, i] == 1))
-                self.model.addConstr(gp.quicksum(self.b['col'][i, j, k] for k in range(pre, self.n-suf-l+1)) == 1)
+                        self.model.addGenConstrIndicator(self.b['col'][i, j, k], True, self.ans[k+t, i] == 1)
+                self.model.addConstr(quicksum(self.b['col'][i, j, k] for k in range(first, last+1)) == 1)
     
     def strategy_bdefault(self):
         self.strategy_b()
         for i in range(self.n):
-            self.model.addConstr(gp.quicksum(self.ans[i, j] for j in range(self.m)) == sum(self.board['row'][i]))
+            self.model.addConstr(quicksum(self.ans[i, j] for j in range(self.m)) == sum(self.board['row'][i]))
         for j in range(self.m):
-            self.model.addConstr(gp.quicksum(self.ans[i, j] for i in range(self.n)) == sum(self.board['col'][j]))
+            self.model.addConstr(quicksum(self.ans[i, j] for i in range(self.n)) == sum(self.board['col'][j]))
     
     def strategy_bminimize(self):
         self.strategy_b()
-        obj = gp.quicksum(self.ans[i, j] for i in range(self.n) for j in range(self.m))
+        obj = quicksum(self.ans[i, j] for i in range(self.n) for j in range(self.m))
         self.model.setObjective(obj, GRB.MINIMIZE)
 
+    def strategy_line(self):
+        '''
+        Solve without a model: every row and column is a pair of bitsets of its known filled and empty cells, narrowed
+        by the cached line solver over a queue of dirty lines. Open cells are then probed, a value that runs into a
+        contradiction fixes the other one and the cells both values agree on are fixed, and when probing is stuck
+        the search branches on an open cell, up to self.limit solutions.
+        '''
+        if any(-1 in clue for d in ['row', 'col'] for clue in self.board[d]):
+            raise NotImplementedError
+        self.native = True
+        self.clues = {d: [tuple(clue) for clue in self.board[d]] for d in ['row', 'col']}
+        self.length = {'row': self.m, 'col': self.n}
+        state = {'row': [(0, 0)] * self.n, 'col': [(0, 0)] * self.m}
+        self.solutions = []
+        self.search(state, [('row', i) for i in range(self.n)] + [('col', j) for j in range(self.m)])
+
+    def assign(self, state, i, j, v):
+        '''
+        Set cell (i, j) to v in both its row and its column
+        Returns:
+            lines: list, the two lines to propagate
+        '''
+        for d, k, p in [('row', i, j), ('col', j, i)]:
+            bits = list(state[d][k])
+            bits[1 - v] |= 1 << p
+            state[d][k] = tuple(bits)
+        return [('row', i), ('col', j)]
+
+    def propagate(self, state, lines):
+        '''
+        Run the line solver on the lines and on every line crossing a cell it decides, until nothing changes
+        Returns:
+            feasible: bool, False if some line has no placement
+        '''
+        queue = deque(lines)
+        dirty = set(lines)
+        while queue:
+            d, i = queue.popleft()
+            dirty.discard((d, i))
+            ones, zeros = state[d][i]
+            bits = solve_bits(self.clues[d][i], self.length[d], ones, zeros)
+            if bits is None:
+                return False
+            if bits == (ones, zeros):
+                continue
+            state[d][i] = bits
+            other = 'col' if d == 'row' else 'row'
+            for new, v in [(bits[0] & ~ones, 1), (bits[1] & ~zeros, 0)]:
+                while new:
+                    j = (new & -new).bit_length() - 1
+                    new &= new - 1
+                    cross = list(state[other][j])
+                    cross[1 - v] |= 1 << i
+                    state[other][j] = tuple(cross)
+                    if (other, j) not in dirty:
+                        dirty.add((other, j))
+                        queue.append((other, j))
+        return True
+
+    def open_cells(self, state):
+        full = (1 << self.m) - 1
+        return [(i, j) for i, (ones, zeros) in enumerate(state['row']) for j in range(self.m) if (full & ~(ones | zeros)) >> j & 1]
+
+    def probe(self, state):
+        '''
+        Try both values of every open cell on a propagated state, in place until no probe decides anything
+        Returns:
+            feasible: bool, False if both values of some cell run into a contradiction
+        '''
+        progress = True
+        while progress:
+            progress = False
+            for i, j in self.open_cells(state):
+                ones, zeros = state['row'][i]
+                if (ones | zeros) >> j & 1:
+                    continue
+                branches = []
+                for v in [1, 0]:
+                    branch = {d: list(bits) for d, bits in state.items()}
+                    branches.append(branch if self.propagate(branch, self.assign(branch, i, j, v)) else None)
+                filled, empty = branches
+                if filled is None and empty is None:
+                    return False
+                if filled is None or empty is None:
+                    state.update(empty or filled)
+                    progress = True
+                    continue
+                changed = []
+                for d in state:
+                    for k, (a, b) in enumerate(zip(filled[d], empty[d])):
+                        bits = (a[0] & b[0], a[1] & b[1])
+                        if bits != state[d][k]:
+                            state[d][k] = bits
+                            changed.append((d, k))
+                if changed:
+                    if not self.propagate(state, changed):
+                        return False
+                    progress = True
+        return True
+
+    def search(self, state, lines):
+        if not self.propagate(state, lines) or not self.probe(state):
+            return
+        cells = self.open_cells(state)
+        if not cells:
+            self.solutions.append(np.array([[ones >> j & 1 for j in range(self.m)] for ones, _ in state['row']], dtype=int))
+            return
+        i, j = cells[0]
+        for v in [1, 0]:
+            branch = {d: list(bits) for d, bits in state.items()}
+            self.search(branch, self.assign(branch, i, j, v))
+            if len(self.solutions) >= self.limit:
+                return
+
     def strategy_bank(self):
-        return {'default': self.strategy_default, 'b': self.strategy_bdefault, 'bmin': self.strategy_bminimize}
+        return {'default': self.strategy_default, 'b': self.strategy_bdefault, 'bmin': self.strategy_bminimize, 'line': self.strategy_line}
     
+    def init_nogood(self):
+        return self.nogood_binary()
+
     def init_clone(self):
         self.clone.neq = self.clone.model.addVars(self.n, self.m, vtype=GRB.BINARY, name='neq')
         for i in range(self.n):
             for j in range(self.m):
-                self.clone.model.addConstr((self.clone.neq[i, j] == 1) >> (self.clone.ans[i, j] + round(self.ans[i, j].X) == 1))
-        self.clone.model.addConstr(self.clone.neq.sum() >= 1)
+                self.clone.model.addGenConstrIndicator(self.clone.neq[i, j], True, self.clone.ans[i, j] + self.value(i, j) == 1)
+        self.clone.model.addConstr(quicksum(self.clone.neq.values()) >= 1)
     
     def pretty(self):
         try:
             res = ''
             for i in range(self.n):
                 for j in range(self.m):
-                    t = round(self.ans[i, j].X)
+                    t = self.value(i, j)
                     res += '#' if t else '.'
                 res += '\n'
             if self.check:
@@ -198,12 +370,7 @@ class Nonograms(Puzzle):
     
     def __str__(self):
         try:
-            res = ''
-            for i in range(self.n):
-                for j in range(self.m):
-                    t = round(self.ans[i, j].X)
-                    res += 'y' if t else 'n'
-            return res
+            return flags(self.solution_array())
         except Exception as e:
             if self.debug:
                 raise e
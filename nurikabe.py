@@ -1,4 +1,5 @@
 import os
+import cProfile
 import numpy as np
 from puzzle import Puzzle, PuzzleParser
 from argparse import ArgumentParser
@@ -6,60 +7,128 @@ from online import fetch, submit, hall
 import gurobipy as gp
 from gurobipy import GRB
 from board import Board
+from scheduler import current
+from codec import decode, square, flags
 
 class Nurikabe(Puzzle):
-    def __init__(self, input, name='Nurikabe', check=False, solve=True, strategy='default', debug=False):
+    def __init__(self, input, name='Nurikabe', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
         self.name = name
         self.debug = debug
         self.input = input
         self.strategy = strategy
         self.check = check
+        self.params = params or {}
+        self.cache = cache
+        if backend != 'gurobi':
+            raise ValueError(f'Nurikabe needs the gurobi backend, got {backend}')
+        if strategy == 'portfolio':
+            raise ValueError('Nurikabe has no portfolio strategy, choose default or lazy')
+        self.backend = backend
+        self.warm = warm
+        self.profile = profile
+        self.profiler = cProfile.Profile() if profile else None
         if debug:
             print(f'Name: {self.name}\nInput: {self.input}\nSolve: {solve}\nCheck: {check}\nStrategy: {strategy}')
-        self.board = self.read(self.input)
-        if solve:
-            self.board.solve()
+        self.timings = {}
+        self.phases = []
+        self.stats = {'timings': self.timings}
+        self.array = None
+        self.limit = 2 if check else 1
+        with self.timer('parse'):
+            self.board = self.read(self.input)
+        self.model = self.board.model
+        self.ans = self.board.ans
+        if solve and not check:
+            self.cached = self.lookup()
+        elif solve and warm is None:
+            self.warm = warm = self.cached_solution()
+        if not self.cached:
+            with self.timer('build'):
+                self.strategy_bank()[self.strategy]()
+        if solve and not self.cached:
+            if warm is not None:
+                self.warm_start(warm)
+            with self.timer('optimize'):
+                self.optimize()
+            self.collect_stats()
+            self.store()
         if solve and check:
             try:
-                self.unique = self.check_unique()
+                with self.timer('check'):
+                    self.unique = self.check_unique()
             except Exception as e:
                 if debug:
                     raise e
                 self.unique = f'Error: {e}'
 
     def parse_from_task(self, task):
-        self.raw = []
-        while task:
-            if task[0] == '_':
-                task = task[1:]
-            if len(task) >= 2 and task[:2].isdigit():
-                self.raw.append(int(task[:2]))
-                task = task[2:]
-            elif task[0].isdigit():
-                self.raw.append(int(task[0]))
-                task = task[1:]
-            else:
-                cnt = ord(task[0]) - ord('a') + 1
-                self.raw += [0] * cnt
-                task = task[1:]
-        self.n = round(np.sqrt(len(self.raw)))
-        if self.n * self.n != len(self.raw):
-            raise ValueError(f'Invalid length of task: {len(self.raw)}')
-        self.board = Board(self.n, self.n, self.name)
+        self.raw = decode(task).tolist()
+        self.n = len(square(self.raw))
+        if self.strategy == 'auto':
+            self.strategy = self.select()
+        self.board = Board(self.n, self.n, self.name, lazy=self.strategy == 'lazy')
         if not self.debug:
             self.board.model.setParam('OutputFlag', 0)
+        for key, value in self.params.items():
+            self.board.model.setParam(key, value)
         for x in range(self.n):
             for y in range(self.n):
                 c = self.raw[x * self.n + y]
                 if c:
                     self.board.clue_size(x, y, int(c))
+        return self.board
+
+    def canonical(self):
+        '''
+        The clue grid under the rotations and reflections of the square, the smallest image is the key
+        '''
+        grid = np.array(self.raw).reshape(self.n, self.n)
+        image, k, flip = min((np.rot90(np.flipud(grid) if flip else grid, k).flatten().tolist(), k, flip)
+                             for k in range(4) for flip in (False, True))
+        def forward(grid):
+            return np.rot90(np.flipud(grid) if flip else grid, k)
+        def backward(grid):
+            grid = np.rot90(grid, -k)
+            return np.flipud(grid) if flip else grid
+        return ','.join(map(str, image)), forward, backward
+
+    def features(self):
+        '''
+        Read before the board is built, the strategy decides whether the board is lazy
+        '''
+        return {'size': self.n, 'clues': sum(1 for c in self.raw if c) / len(self.raw)}
+
+    def strategy_default(self):
         self.board.build_size()
         self.board.rule_connected(1)
         self.board.rule_no2x2()
         self.board.rule_nurikabe()
         # self.board.rule_allmarked(0)
-        return self.board
-    
+
+    def strategy_lazy(self):
+        '''
+        Same rules on a lazy board: connectivity is enforced by cuts in a callback instead of flows
+        '''
+        self.strategy_default()
+
+    def strategy_bank(self):
+        return {'default': self.strategy_default, 'lazy': self.strategy_lazy}
+
+    def optimize(self):
+        self.array = None
+        with current().reserve(self.model, self.params.get('Threads')) as threads:
+            self.stats['threads'] = threads
+            self.board.solve()
+
+    def pooled(self):
+        '''
+        Pool solutions skip the connectivity cuts of the lazy board
+        '''
+        return super().pooled() and self.strategy != 'lazy'
+
+    def init_nogood(self):
+        return self.nogood_binary()
+
     def pretty(self):
         try:
             res = ''
@@ -70,7 +139,7 @@ class Nurikabe(Puzzle):
                             res += chr(ord('A') + self.raw[i * self.n + j] - 10)
                         else:
                             res += str(self.raw[i * self.n + j])
-                    elif self.board.ans[i, j].X > 0.5:
+                    elif self.value(i, j):
                         res += '#'
                     else:
                         res += '.'
@@ -85,14 +154,7 @@ class Nurikabe(Puzzle):
         
     def __str__(self):
         try:
-            res = ''
-            for i in range(self.n):
-                for j in range(self.n):
-                    if self.board.ans[i, j].X > 0.5:
-                        res += 'y'
-                    else:
-                        res += 'n'
-            return res
+            return flags(self.solution_array())
         except Exception as e:
             if self.debug:
                 raise e
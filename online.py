@@ -2,7 +2,11 @@ import requests
 import os
 import re
 import retry
+from functools import lru_cache
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
 
+@lru_cache(maxsize=None)
 def token():
     '''
     Prepare your api_token in 'api.txt'
@@ -11,6 +15,19 @@ def token():
         api_token = f.read().strip()
     return api_token
 
+@lru_cache(maxsize=None)
+def session():
+    '''
+    The shared keep-alive session of all requests, safe to use from several threads
+    Returns:
+        session: requests.Session, keeping up to 32 connections alive per host
+    '''
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
 @retry.retry(tries=5, delay=1)
 def fetch(url:str, new=True):
     '''
@@ -30,7 +47,7 @@ def fetch(url:str, new=True):
     data = {'robot': 1}
     if new:
         data['new'] = '+++New+Puzzle+++'
-    response = requests.post(url, headers=headers, data=data)
+    response = session().post(url, headers=headers, data=data)
     task = re.search(r'var task = \'(.*?)\';', response.text).group(1)
     param = re.search(r'name="param" value="(.*?)"', response.text).group(1)
     return task, param
@@ -53,7 +70,7 @@ def submit(url:str, result:str, param:str):
     api_token = token()
     headers = {'Cookie': f'api_token={api_token}'}
     data = {'robot': 1, 'ansH': result, 'param': param, 'ready': 'Done'}
-    response = requests.post(url, headers=headers, data=data)
+    response = session().post(url, headers=headers, data=data)
     verdict = re.search(r'<div id="ajaxResponse"><p class="(.*?)">(.*?)</p>', response.text).group(2)
     try:
         solparam = re.search(r'name="solparams" value="(.*?)"', response.text).group(1)
@@ -75,11 +92,10 @@ def hall(url:str, solparam:str):
         code: int, the status code of the response
     '''
     api_token = token()
-    domain = re.search(r'www\.(.*?)\.com', url).group(1)
-    url = f'https://www.{domain}.com/hallsubmit.php'
+    url = urljoin(url, '/hallsubmit.php')
     headers = {'Cookie': f'api_token={api_token}'}
     data = {'solparams': solparam, 'robot': 1}
-    response = requests.post(url, headers=headers, data=data)
+    response = session().post(url, headers=headers, data=data)
     return response.status_code
 
 
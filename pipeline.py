@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from online import fetch, submit, hall
+import batch
+from scheduler import install, current
+
+class Pipeline:
+    '''
+    Pipelined online runner
+    Every puzzle in flight owns a network thread which fetches the task, waits for a solver
+    process and submits the result, so fetching and submitting overlap with solving.
+    All requests share the keep-alive session of online.session(), the solver processes share the core budget of
+    the scheduler.
+    Args:
+        url: str, the url of the online puzzle
+        solver_class: type, the Puzzle subclass to solve with
+        prefetch: int, the maximum number of puzzles fetched but not yet submitted
+        workers: int, the number of solver processes
+        debug: bool, print the task and result of every puzzle
+        kwargs: passed to the solver, e.g. strategy, params
+    '''
+    def __init__(self, url, solver_class, prefetch=4, workers=None, debug=False, **kwargs):
+        self.url = url
+        self.solver_class = solver_class
+        self.prefetch = prefetch
+        self.workers = workers
+        self.debug = debug
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+
+    def report(self, *lines):
+        with self.lock:
+            for line in lines:
+                print(line, flush=True)
+
+    def process(self, pool):
+        try:
+            task, param = fetch(self.url)
+            record = pool.submit(batch.solve_one, (self.solver_class, task, self.kwargs)).result()
+            result = record['result']
+            if record['status'] != 'solved':
+                # report the failed solve instead of submitting an empty answer
+                response = record['status'] if record['status'].startswith('Error') else f"Error: {record['status']}"
+            else:
+                response, solparam = submit(self.url, result, param)
+                if solparam:
+                    code = hall(self.url, solparam)
+                    if code == 200:
+                        response += ' (submit to hall successfully)'
+                    else:
+                        response += f' (Error: {code})'
+            lines = [response]
+            if self.debug:
+                lines += [f'task: {task}', f'result: {result}', f"time: {record['time']:.3f}s"]
+            if 'stats' in record:
+                lines.append(f"stats: {record['stats']}")
+            self.report(*lines)
+            return response
+        except Exception as e:
+            self.report(f'Error: {e}')
+            return f'Error: {e}'
+
+    def run(self, n):
+        '''
+        Solve n online puzzles
+        Args:
+            n: int, the number of puzzles
+        Returns:
+            responses: list, the verdicts in the order of the puzzles
+        '''
+        with ThreadPoolExecutor(self.prefetch) as net, ProcessPoolExecutor(self.workers, initializer=install, initargs=(current(),)) as pool:
+            futures = [net.submit(self.process, pool) for _ in range(n)]
+            return [future.result() for future in futures]
@@ -1,37 +1,185 @@
 import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import io
 import numpy as np
 from argparse import ArgumentParser
+from contextlib import contextmanager, nullcontext
 from online import fetch, submit, hall
+import queue
+import threading
+import warnings
+import batch
+from pipeline import Pipeline
+from cache import Cache
+from backend import BACKENDS, local, make_model, thread_env, quicksum
+from scheduler import Scheduler, install, current
 import gurobipy as gp
 from gurobipy import GRB
 
 class Puzzle():
-    def __init__(self, input, name, check=False, solve=True, strategy='default', debug=False):
+    native = False
+    cached = False
+    complete = False
+    templated = False
+    expired = False
+    cancel = None
+    share = None
+    template_attrs = ('ans',)
+    templates = {}
+    templates_lock = threading.Lock()
+    selection = None
+    selection_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'selection.json')
+    statistics = ['NumVars', 'NumBinVars', 'NumIntVars', 'NumConstrs', 'NumGenConstrs', 'NumNZs',
+                  'NodeCount', 'IterCount', 'SolCount', 'Runtime']
+    pool_work = 2
+
+    def __init__(self, input, name, check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
         self.name = name
         self.debug = debug
         self.input = input
         self.strategy = strategy
         self.check = check
-        self.model = gp.Model(name)
+        self.params = params or {}
+        self.cache = cache
+        self.profile = profile
+        self.backend = backend
+        self.warm = warm
+        self.profiler = cProfile.Profile() if profile else None
+        self.timings = {}
+        self.phases = []
+        self.stats = {'timings': self.timings}
+        self.array = None
+        self.limit = 2 if check else 1
+        self.model = make_model(backend, name)
         if debug:
             print(f'Name: {self.name}\nInput: {self.input}\nSolve: {solve}\nCheck: {check}\nStrategy: {strategy}')
-        else:
-            self.model.params.OutputFlag = 0
-        self.board = self.read(self.input)
-        self.init_board()
-        if solve:
+        self.init_params()
+        with self.timer('parse'):
+            self.board = self.read(self.input)
+        if self.strategy == 'auto':
+            self.strategy = self.select()
+        if solve and not check:
+            self.cached = self.lookup()
+        elif solve and warm is None:
+            self.warm = self.cached_solution()
+        if not self.cached:
+            with self.timer('build'):
+                self.init_model()
+        if solve and not self.cached:
             self.ans = self.solve()
+            self.store()
         if solve and check:
             try:
-                self.unique = self.check_unique()
+                with self.timer('check'):
+                    self.unique = self.check_unique()
             except Exception as e:
                 if debug:
                     raise e
                 self.unique = f'Error: {e}'
     
+    @contextmanager
+    def timer(self, phase):
+        '''
+        Add the wall time of the block to self.timings[phase], less the phases timed within it, and profile the build
+        phase if profiling
+        '''
+        profiler = self.profiler if phase == 'build' else None
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        self.phases.append(0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[phase] = self.timings.get(phase, 0) + elapsed - self.phases.pop()
+            if self.phases:
+                self.phases[-1] += elapsed
+            if profiler:
+                profiler.disable()
+
+    def collect_stats(self):
+        '''
+        Read the size and search statistics of the solved model into self.stats, and the size after presolve if profiling
+        '''
+        for name in self.statistics:
+            try:
+                self.stats[name] = self.model.getAttr(name)
+            except (gp.GurobiError, AttributeError):
+                pass
+        if self.profile and self.backend == 'gurobi':
+            presolved = self.model.presolve()
+            self.stats['presolve'] = {name: presolved.getAttr(name) for name in ['NumVars', 'NumConstrs', 'NumGenConstrs', 'NumNZs']}
+            presolved.dispose()
+
+    def report(self, limit=20):
+        '''
+        The timings and statistics, and the hottest functions of the build phase if profiling
+        '''
+        res = 'Timings: ' + ', '.join(f'{phase} {t:.3f}s' for phase, t in self.timings.items()) + '\n'
+        stats = {k: v for k, v in self.stats.items() if k != 'timings'}
+        if stats:
+            res += 'Stats: ' + ', '.join(f'{k} {v}' for k, v in stats.items()) + '\n'
+        if self.profiler:
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+            res += out.getvalue()
+        return res
+
+    def init_params(self):
+        if not self.debug:
+            self.model.setParam('OutputFlag', 0)
+        for key, value in self.params.items():
+            self.model.setParam(key, value)
+
     def init_board(self):
         raise NotImplementedError
 
+    def template_key(self):
+        if self.backend != 'gurobi':
+            return None
+        return (type(self), self.strategy, self.n)
+
+    def init_model(self):
+        '''
+        Build the model, reusing a template when the strategy splits into structure_<strategy>, which depends only on
+        the template key, and clues_<strategy>, which adds the instance data. The first instance of a key builds the
+        structure and keeps a copy, later instances copy it and rebind the variables in template_attrs by index.
+        '''
+        if self.strategy == 'portfolio':
+            return
+        structure = getattr(self, f'structure_{self.strategy}', None) if self.strategy in self.strategy_bank() else None
+        key = self.template_key() if structure else None
+        if key is None:
+            self.init_board()
+            return
+        with Puzzle.templates_lock:
+            template = Puzzle.templates.get(key)
+        if template is None:
+            self.init_board()
+            structure()
+            self.model.update()
+            index = {name: {k: v.index for k, v in getattr(self, name).items()} for name in self.template_attrs}
+            with Puzzle.templates_lock:
+                Puzzle.templates.setdefault(key, (self.model.copy(), index))
+        else:
+            model, index = template
+            self.model.dispose()
+            with Puzzle.templates_lock:
+                self.model = model.copy(env=getattr(local, 'env', None))
+            self.model.resetParams()
+            self.model.ModelName = self.name
+            self.init_params()
+            variables = self.model.getVars()
+            for name, keys in index.items():
+                setattr(self, name, gp.tupledict({k: variables[i] for k, i in keys.items()}))
+        getattr(self, f'clues_{self.strategy}')()
+        self.templated = True
+
     def parse_from_task(self, task):
         raise NotImplementedError
     
@@ -52,18 +200,462 @@ class Puzzle():
     
     def strategy_bank(self):
         return {'default': self.strategy_default}
+
+    def features(self):
+        '''
+        Cheap features of the parsed instance, the inputs of the auto strategy
+        Returns:
+            features: dict, name to number, the same names for every instance of the puzzle
+        '''
+        return {'size': self.n}
+
+    @classmethod
+    def load_selection(cls):
+        '''
+        The selection table of the auto strategy, fitted from benchmark records by bench.py fit and read once
+        Returns:
+            table: dict, {puzzle class: {backend: {'features': names, 'rows': [[*values, strategy]]}}}
+        '''
+        if Puzzle.selection is None:
+            try:
+                with open(cls.selection_file, 'r') as f:
+                    Puzzle.selection = json.load(f)['tables']
+            except FileNotFoundError:
+                Puzzle.selection = {}
+        return Puzzle.selection
+
+    def select(self):
+        '''
+        The auto strategy: the fastest strategy of the nearest recorded instance in the selection table, features
+        compared on a log scale relative to their range in the table. Falls back to default without rows for the
+        puzzle and backend, subclasses without rows of their own use those of their parent.
+        Returns:
+            strategy: str, a strategy of the bank
+        '''
+        bank = self.strategy_bank()
+        strategy = 'default'
+        tables = self.load_selection()
+        table = next((tables[c.__name__][self.backend] for c in type(self).__mro__ if self.backend in tables.get(c.__name__, {})), None)
+        if len(bank) > 1 and table and table['rows']:
+            features = self.features()
+            rows = np.log1p(np.array([row[:-1] for row in table['rows']], dtype=float))
+            point = np.log1p(np.array([features[k] for k in table['features']], dtype=float))
+            span = rows.max(axis=0) - rows.min(axis=0)
+            span[span == 0] = 1
+            nearest = int(np.argmin((((rows - point) / span) ** 2).sum(axis=1)))
+            strategy = table['rows'][nearest][-1]
+        if strategy not in bank:
+            strategy = 'default'
+        self.stats['auto'] = strategy
+        if self.debug:
+            print(f'Auto strategy: {strategy}')
+        return strategy
     
     def solve(self):
-        self.strategy_bank()[self.strategy]()
-        self.model.optimize()
+        if self.strategy == 'portfolio':
+            with self.timer('optimize'):
+                self.race()
+            return getattr(self, 'ans', None)
+        if not self.templated and not self.native:
+            with self.timer('build'):
+                self.strategy_bank()[self.strategy]()
+        if not self.native:
+            if self.warm is not None:
+                self.warm_start(self.warm)
+            with self.timer('optimize'):
+                self.optimize()
+            self.collect_stats()
         return self.ans
+
+    def reserve(self, model, threads=None):
+        '''
+        Reserve the threads of a solve from the scheduler. The racers of a portfolio run on their share of the
+        threads the race reserved once for all of them, so they do not wait on each other
+        Returns:
+            context: a context manager giving the threads of the solve
+        '''
+        if self.share:
+            threads = min(threads or self.share, self.share)
+            model.setParam('Threads', threads)
+            return nullcontext(threads)
+        return current().reserve(model, threads)
+
+    def optimize(self):
+        self.array = None
+        with self.reserve(self.model, self.params.get('Threads')) as threads:
+            self.stats['threads'] = threads
+            if self.cancel is not None and self.cancel.is_set():
+                return
+            self.model.optimize()
+
+    def race(self):
+        '''
+        The portfolio strategy: every strategy of the bank solves in a thread with its own gurobipy Env, the first one
+        solved or proven infeasible wins and the others are terminated. TimeLimit bounds the whole race, the status is
+        timeout when it runs out without a winner. The puzzle takes over the state of the winner, the losers are stopped
+        in the background. The threads of the race are reserved once and split between the racers, every racer returns
+        its part when its thread ends. A racer without a part, when there are more strategies than threads, still runs
+        on one thread.
+        '''
+        limit = self.params.get('TimeLimit')
+        strategies = list(self.strategy_bank())
+        scheduler = current()
+        reserved = min(self.params.get('Threads') or scheduler.cores, scheduler.cores)
+        scheduler.acquire(reserved)
+        start = time.perf_counter()
+        cancel = threading.Event()
+        done = queue.Queue()
+        racers = {}
+        parts = {s: reserved // len(strategies) + (k < reserved % len(strategies)) for k, s in enumerate(strategies)}
+        def run(strategy):
+            try:
+                if self.backend == 'gurobi':
+                    thread_env()
+                racer = self.__class__(self.input, name=f'{self.name} {strategy}', solve=False, strategy=strategy, debug=self.debug,
+                                       params=self.params, backend=self.backend, warm=self.warm)
+                racer.cancel = cancel
+                racer.share = max(1, parts[strategy])
+                racer.limit = self.limit
+                racers[strategy] = racer
+                racer.ans = racer.solve()
+                done.put((strategy, racer))
+            except Exception as e:
+                done.put((strategy, e))
+            finally:
+                # native racers cannot be terminated, their part is held until they finish
+                scheduler.release(parts[strategy])
+        threads = {s: threading.Thread(target=run, args=(s,), daemon=True) for s in strategies}
+        for thread in threads.values():
+            thread.start()
+        winner, errors = None, []
+        for _ in strategies:
+            try:
+                strategy, racer = done.get(timeout=None if limit is None else max(0, start + limit - time.perf_counter()))
+            except queue.Empty:
+                break
+            if isinstance(racer, Exception):
+                errors.append(racer)
+            elif racer.status() in ['solved', 'infeasible']:
+                winner = racer
+                break
+        cancel.set()
+        def reap():
+            # a racer may enter optimize just after the cancel, native strategies cannot be stopped at all
+            pending = lambda: [s for s, t in threads.items() if t.is_alive() and not (s in racers and racers[s].native)]
+            while pending():
+                for s in pending():
+                    if s in racers:
+                        racers[s].model.terminate()
+                    threads[s].join(0.01)
+        # not a daemon, the interpreter waits for it at exit instead of killing a solver mid search
+        threading.Thread(target=reap).start()
+        if winner is None:
+            if len(errors) == len(strategies):
+                raise errors[0]
+            self.expired = True
+            return
+        keep = {k: getattr(self, k) for k in ['name', 'check', 'limit', 'timings', 'phases', 'stats', 'profiler', 'cache', 'warm']}
+        self.model.dispose()
+        self.__dict__.update(winner.__dict__)
+        self.__dict__.update(keep)
+        self.cancel = None
+        self.share = None
+        self.stats.update({k: v for k, v in winner.stats.items() if k != 'timings'})
+        self.stats['portfolio'] = winner.strategy
+        if self.debug:
+            print(f'Portfolio won by {winner.strategy} in {time.perf_counter() - start:.3f}s')
+
+    def solution_array(self):
+        '''
+        The solution as an integer array indexed like ans, read with a single getAttr and kept until the next optimize
+        '''
+        if self.expired:
+            raise ValueError('Time limit reached without a solution')
+        if self.native:
+            if not self.solutions:
+                raise ValueError('No solution found')
+            return self.solutions[0]
+        if self.array is None:
+            self.array = self.read_array('X')
+        return self.array
+
+    def read_array(self, attr):
+        keys = list(self.ans.keys())
+        values = self.model.getAttr(attr, [self.ans[k] for k in keys])
+        array = np.zeros(tuple(max(k[d] for k in keys) + 1 for d in range(2)), dtype=int)
+        array[tuple(zip(*keys))] = np.rint(values)
+        return array
+
+    def value(self, i, j):
+        return int(self.solution_array()[i, j])
+
+    def warm_start(self, grid, attr='Start'):
+        '''
+        Feed known values of ans to the next optimize
+        Example:
+            >>> puzzle.warm_start(solution)
+            >>> clone.warm_start(puzzle.solution_array(), 'VarHintVal')
+        Args:
+            grid: integer array indexed like ans, negative entries are unknown
+            attr: str, 'Start' for a MIP start, which Gurobi completes when partial, or 'VarHintVal' for branching hints
+        '''
+        keys = [k for k in self.ans.keys() if grid[k] >= 0]
+        self.model.setAttr(attr, [self.ans[k] for k in keys], [int(grid[k]) for k in keys])
+
+    def fix(self, variables, values):
+        '''
+        Fix the variables to the values through their bounds
+        '''
+        values = [int(v) for v in values]
+        self.model.setAttr('LB', variables, values)
+        self.model.setAttr('UB', variables, values)
     
+    def canonical(self):
+        '''
+        Key of the parsed board in the solution cache, None if the puzzle is not cached
+        Returns:
+            key: str, equal for boards sharing a solution up to the maps
+            forward: function, map of a solution of the board to the solution of the key
+            backward: function, the inverse of forward
+        '''
+        key = json.dumps(self.board, sort_keys=True, default=lambda x: x.tolist())
+        return key, lambda grid: grid, lambda grid: grid
+
+    def cached_solution(self):
+        if self.cache is None:
+            return None
+        self.canon = self.canonical()
+        if self.canon is None:
+            return None
+        key, forward, backward = self.canon
+        solution = self.cache.get(f'{type(self).__name__}:{key}')
+        if solution is None:
+            return None
+        return backward(np.array(solution))
+
+    def lookup(self):
+        solution = self.cached_solution()
+        if solution is None:
+            return False
+        self.native = True
+        self.solutions = [solution]
+        if self.debug:
+            print('Solution found in the cache')
+        return True
+
+    def store(self):
+        if self.cache is None or self.status() != 'solved':
+            return
+        if not hasattr(self, 'canon'):
+            self.canon = self.canonical()
+        if self.canon is None:
+            return
+        key, forward, backward = self.canon
+        self.cache.put(f'{type(self).__name__}:{key}', forward(self.solution_array()).tolist())
+
     def init_clone(self):
         raise NotImplementedError
     
+    def check_native(self):
+        if len(self.solutions) < 2:
+            return 'The solution is unique'
+        solutions, check = self.solutions, self.check
+        self.solutions, self.check = solutions[1:], False
+        result = self.pretty()
+        self.solutions, self.check = solutions, check
+        return 'The solution is not unique\n' + result
+
+    def init_nogood(self):
+        raise NotImplementedError
+
+    def nogood_binary(self):
+        values = {k: self.value(*k) for k in self.ans.keys()}
+        return [self.model.addConstr(quicksum(1 - self.ans[k] if values[k] else self.ans[k] for k in values) >= 1)]
+
+    def nogood_integer(self):
+        values = {k: self.value(*k) for k in self.ans.keys()}
+        gr = self.model.addVars(values.keys(), vtype=GRB.BINARY, name='nogood_gr')
+        le = self.model.addVars(values.keys(), vtype=GRB.BINARY, name='nogood_le')
+        cut = list(gr.values()) + list(le.values())
+        for k in values:
+            cut.append(self.model.addGenConstrIndicator(gr[k], True, self.ans[k] >= values[k] + 1))
+            cut.append(self.model.addGenConstrIndicator(le[k], True, self.ans[k] <= values[k] - 1))
+        cut.append(self.model.addConstr(quicksum(gr.values()) + quicksum(le.values()) >= 1))
+        return cut
+
+    def check_inplace(self):
+        variables = self.model.getVars()
+        start = self.model.getAttr('X', variables)
+        cut = self.init_nogood()
+        self.optimize()
+        check, self.check = self.check, False
+        result = self.pretty()
+        self.check = check
+        self.model.remove(cut)
+        self.model.setAttr('Start', variables, start)
+        self.optimize()
+        if 'Error' in result:
+            return 'The solution is unique'
+        else:
+            return 'The solution is not unique\n' + result
+
+    def pooled(self):
+        '''
+        Whether the solutions can be enumerated by the solution pool of a single search
+        '''
+        return self.backend == 'gurobi'
+
+    def iter_solutions(self, limit=2):
+        '''
+        Stream the distinct solutions projected on ans, the solution already found first. Native strategies are rerun
+        when they stopped short of the limit, a solution taken from the cache comes alone, as do the solutions of a
+        complete search.
+        Example:
+            >>> [grid for grid in Sudoku('example/sudoku.txt').iter_solutions(limit=5)]
+        Args:
+            limit: int, the most solutions to find
+        Returns:
+            solutions: generator of integer arrays indexed like ans
+        '''
+        if self.native:
+            if len(self.solutions) == self.limit < limit and not self.cached and not self.complete:
+                self.limit = limit
+                self.strategy_bank()[self.strategy]()
+            yield from self.solutions[:limit]
+            return
+        if self.status() != 'solved':
+            return
+        first = self.solution_array()
+        if self.pooled():
+            self.stats['enumeration'] = 'pool'
+            yield from self.pool_solutions(first, limit)
+        else:
+            self.stats['enumeration'] = 'nogood'
+            if self.backend == 'gurobi':
+                self.fallback('no pool search')
+            yield from self.nogood_solutions(first, limit)
+
+    def fallback(self, reason):
+        '''
+        Warn that the solutions of a Gurobi model are enumerated by nogood re-solves instead of the solution pool
+        '''
+        warnings.warn(f'{self.__class__.__name__} {self.strategy}: {reason}, the solutions are counted by nogood re-solves')
+
+    def pool_solutions(self, first, limit):
+        '''
+        Pool search for the solutions, the pool also holds solutions differing only outside ans, so it is widened
+        while it fills up without enough distinct grids. On general constraints the pool search may crawl, as on the
+        Skyscrapers comparisons, so there it gets pool_work times the work of the first solve and the rest is found by
+        nogood re-solves when it runs out.
+        '''
+        objective = self.model.getAttr('ObjVal')
+        saved = {name: self.model.getParamInfo(name)[2] for name in ['PoolSearchMode', 'PoolSolutions', 'SolutionNumber', 'WorkLimit']}
+        work = min(self.pool_work * self.model.Work, saved['WorkLimit'])
+        seen = {first.tobytes()}
+        yield first
+        size = limit
+        crawled = False
+        try:
+            while len(seen) < limit:
+                self.model.setParam('PoolSearchMode', 2)
+                self.model.setParam('PoolSolutions', size)
+                if self.model.NumGenConstrs:
+                    self.model.setParam('WorkLimit', work)
+                self.model.reset()
+                self.optimize()
+                crawled = self.model.Status == GRB.WORK_LIMIT
+                for k in range(self.model.SolCount):
+                    self.model.setParam('SolutionNumber', k)
+                    if self.model.PoolObjVal > objective + 1e-6:
+                        return
+                    grid = self.read_array('Xn')
+                    if grid.tobytes() not in seen:
+                        seen.add(grid.tobytes())
+                        yield grid
+                        if len(seen) == limit:
+                            return
+                if crawled or self.model.SolCount < size or size >= 64 * limit:
+                    break
+                size *= 4
+        finally:
+            for name, value in saved.items():
+                self.model.setParam(name, value)
+            self.array = first
+        if not crawled:
+            return
+        self.stats['enumeration'] = 'nogood'
+        self.fallback('the pool search ran out of work')
+        if not self.model.SolCount:
+            self.model.reset()
+            self.optimize()
+        solutions = self.nogood_solutions(first, limit)
+        try:
+            for grid in solutions:
+                if grid.tobytes() not in seen:
+                    seen.add(grid.tobytes())
+                    yield grid
+                    if len(seen) == limit:
+                        return
+        finally:
+            solutions.close()
+
+    def nogood_solutions(self, first, limit):
+        '''
+        A no-good cut per solution, for backends without a solution pool, the cuts are removed and the model re-solved
+        from the first solution afterwards
+        '''
+        variables = self.model.getVars()
+        start = self.model.getAttr('X', variables)
+        objective = self.model.getAttr('ObjVal')
+        cuts = []
+        yield first
+        try:
+            for _ in range(limit - 1):
+                cuts += self.init_nogood()
+                self.optimize()
+                if self.status() != 'solved' or self.model.getAttr('ObjVal') > objective + 1e-6:
+                    return
+                yield self.solution_array()
+        finally:
+            self.model.remove(cuts)
+            self.model.setAttr('Start', variables, start)
+            self.optimize()
+            self.array = first
+
+    def count_solutions(self, limit=2):
+        '''
+        Example:
+            >>> Sudoku('example/sudoku.txt').count_solutions(limit=10)
+            1
+        Returns:
+            count: int, the number of distinct solutions, limit meaning at least limit
+        '''
+        return sum(1 for _ in self.iter_solutions(limit))
+
+    def check_pool(self):
+        if self.backend == 'gurobi' and self.model.NumGenConstrs:
+            # the pool search crawls on general constraints, the inequality Sudoku takes 100s against 35s in place
+            return self.check_inplace()
+        solutions = list(self.iter_solutions(2))
+        if len(solutions) < 2:
+            return 'The solution is unique'
+        array, check = self.array, self.check
+        self.array, self.check = solutions[1], False
+        result = self.pretty()
+        self.array, self.check = array, check
+        return 'The solution is not unique\n' + result
+
     def check_unique(self):
-        self.clone = self.__class__(self.input, name=self.name + ' Clone', solve=False, strategy=self.strategy, debug=self.debug)
+        if self.native:
+            return self.check_native()
+        if self.check == 'pool':
+            return self.check_pool()
+        if self.check != 'clone':
+            return self.check_inplace()
+        self.clone = self.__class__(self.input, name=self.name + ' Clone', solve=False, strategy=self.strategy, debug=self.debug, params=self.params,
+                                    backend=self.backend)
         self.init_clone()
+        self.clone.warm_start(self.solution_array(), 'VarHintVal')
         self.clone.ans = self.clone.solve()
         result = self.clone.pretty()
         if 'Error' in result:
@@ -71,6 +663,15 @@ class Puzzle():
         else:
             return 'The solution is not unique\n' + result
     
+    def status(self):
+        if self.expired:
+            return 'timeout'
+        if self.native:
+            return 'solved' if self.solutions else 'infeasible'
+        status = {GRB.OPTIMAL: 'solved', GRB.INFEASIBLE: 'infeasible', GRB.INF_OR_UNBD: 'infeasible',
+                  GRB.TIME_LIMIT: 'timeout', GRB.INTERRUPTED: 'interrupted'}
+        return status.get(self.model.Status, 'error')
+
     def pretty(self):
         raise NotImplementedError
 
@@ -78,17 +679,32 @@ class Puzzle():
         raise NotImplementedError
 
 class PuzzleParser(ArgumentParser):
+    strategy_help = 'Strategy to solve the puzzle, auto to pick one from the benchmark records or portfolio to race them all'
+
     def __init__(self, description='Puzzle Solver', default='normal'):
         super().__init__(description=description)
         self.config = self.init_config()
         self.add_argument('-f', '--file', type=str, help='File containing the puzzle')
         self.add_argument('-o', '--output', type=str, help='File to save the solution')
         self.add_argument('--type', type=str, default=default, help='Type of puzzle', choices=self.config.keys())
-        self.add_argument('--check', action='store_true', help='Check if the solution is unique')
-        self.add_argument('--strategy', type=str, default='default', help='Strategy to solve the puzzle')
+        self.add_argument('--check', nargs='?', const='inplace', default=False, choices=['inplace', 'clone', 'pool'], help='Check if the solution is unique, by a no-good cut on the solved model or on a rebuilt clone, or by a pool search on models without general constraints')
+        self.add_argument('--strategy', type=str, default='default', help=self.strategy_help)
         self.add_argument('--debug', action='store_true', help='Print debug information')
         self.add_argument('--online', action='store_true', help='Solve puzzle online')
         self.add_argument('-n', type=int, default=1, help='Number of puzzles to solve')
+        self.add_argument('--batch', type=str, help='Directory or glob of puzzle files to solve in batch')
+        self.add_argument('--tasks', type=str, help='File of online tasks to solve in batch, one per line')
+        self.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes in batch mode')
+        self.add_argument('--threads', type=int, help='Number of solver threads per puzzle, by the size of the model if not given')
+        self.add_argument('--cores', type=int, default=os.cpu_count(), help='Number of cores shared by the threads of all solves')
+        self.add_argument('--pipeline', action='store_true', help='Overlap fetching, solving and submitting in online mode')
+        self.add_argument('--prefetch', type=int, default=4, help='Number of online puzzles in flight in pipeline mode')
+        self.add_argument('--url', type=str, help='Url of the online puzzle, overriding --domain and --diff')
+        self.add_argument('--cache', type=str, help='SQLite file caching the solutions, skipped when checking uniqueness')
+        self.add_argument('--cache-size', type=int, default=100000, help='Maximum number of cached solutions, 0 for no limit')
+        self.add_argument('--backend', type=str, default='gurobi', choices=BACKENDS, help='Solver of the models, cpsat needs ortools')
+        self.add_argument('--profile', action='store_true', help='Print the timings and model statistics, and profile the model build')
+        self.add_argument('--count', type=int, help='Count the solutions up to this limit')
         self.add_extra_args()
 
     def init_config(self):
@@ -103,12 +719,23 @@ class PuzzleParser(ArgumentParser):
     
     def main(self):
         self.args = self.parse_args()
-        if self.args.online:
-            url = self.url()
+        cache = Cache(self.args.cache, self.args.cache_size) if self.args.cache else None
+        params = {'Threads': self.args.threads} if self.args.threads else {}
+        install(Scheduler(self.args.cores))
+        if self.args.online and self.args.pipeline:
+            url = self.args.url or self.url()
+            solver_class = self.config[self.args.type]['class']
+            pipeline = Pipeline(url, solver_class, self.args.prefetch, self.args.workers, self.args.debug,
+                                strategy=self.args.strategy, params=params, cache=cache,
+                                profile=self.args.profile, backend=self.args.backend)
+            pipeline.run(self.args.n)
+        elif self.args.online:
+            url = self.args.url or self.url()
             for i in range(self.args.n):
                 task, param = fetch(url)
                 solver_class = self.config[self.args.type]['class']
-                solver = solver_class(task, check=False, strategy=self.args.strategy)
+                solver = solver_class(task, check=False, strategy=self.args.strategy, params=params, cache=cache, profile=self.args.profile,
+                                      backend=self.args.backend)
                 result = str(solver)
                 response, solparam = submit(url, result, param)
                 if not solparam:
@@ -125,17 +752,36 @@ class PuzzleParser(ArgumentParser):
                     # print(f'parsed: {solver.parse(task)}')
                     print(f'result: {result}')
                     print(solver.pretty())
+                if self.args.profile:
+                    print(solver.report())
+        elif self.args.batch or self.args.tasks:
+            inputs = batch.collect(self.args.batch) if self.args.batch else batch.tasks(self.args.tasks)
+            solver_class = self.config[self.args.type]['class']
+            output = open(self.args.output, 'w') if self.args.output else sys.stdout
+            try:
+                batch.run(solver_class, inputs, output, self.args.workers, check=self.args.check,
+                          strategy=self.args.strategy, params=params, cache=cache,
+                          profile=self.args.profile, backend=self.args.backend)
+            finally:
+                if self.args.output:
+                    output.close()
         else:
             if not self.args.file:
                 self.args.file = self.config[self.args.type]['file']
             solver_class = self.config[self.args.type]['class']
-            solver = solver_class(self.args.file, check=self.args.check, strategy=self.args.strategy, debug=self.args.debug)
+            solver = solver_class(self.args.file, check=self.args.check, strategy=self.args.strategy, debug=self.args.debug, params=params,
+                                  cache=None if self.args.count else cache, profile=self.args.profile, backend=self.args.backend)
             result = solver.pretty()
             if self.args.output:
                 with open(self.args.output, 'w') as f:
                     f.write(result)
             else:
                 print(result)
+            if self.args.count:
+                count = solver.count_solutions(self.args.count)
+                print(f'Solutions: {count}' + (' or more' if count == self.args.count else ''))
+            if self.args.profile:
+                print(solver.report())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+import os
+import multiprocessing
+from contextlib import contextmanager
+from backend import CpSat
+
+class Scheduler():
+    '''
+    Core budget shared by concurrent solves, in threads of one process or in the workers of a pool
+
+    Every solve reserves its threads before optimizing and returns them afterwards, a solve waits while the budget
+    is short. Without an explicit thread count the threads of a Gurobi model follow its size, small models gain
+    nothing from more threads and leave the cores to other solves. CP-SAT keeps its own worker count, its portfolio
+    of workers needs several to be effective, and the solve reserves all cores for them.
+
+    Example:
+        scheduler = Scheduler(8)
+        with Pool(4, initializer=install, initargs=(scheduler,)) as pool:
+            ...
+        with current().reserve(model):
+            model.optimize()
+
+    Args:
+        cores: int, the number of cores shared by all solves, default os.cpu_count()
+    '''
+    sizes = [(2000, 1), (20000, 2), (100000, 4)]
+
+    def __init__(self, cores=None):
+        self.cores = cores or os.cpu_count() or 1
+        self.condition = multiprocessing.Condition()
+        self.free = multiprocessing.RawValue('i', self.cores)
+
+    def threads(self, model):
+        '''
+        Returns:
+            threads: int, the threads for the model by its number of variables and constraints, all cores for CP-SAT
+        '''
+        if isinstance(model, CpSat):
+            return self.cores
+        model.update()
+        size = model.getAttr('NumVars') + model.getAttr('NumConstrs')
+        for bound, threads in self.sizes:
+            if size < bound:
+                return min(threads, self.cores)
+        return self.cores
+
+    @contextmanager
+    def reserve(self, model, threads=None):
+        '''
+        Reserve the threads of a solve and set them on the model
+        Args:
+            model: the model to solve
+            threads: int, the threads of the solve, by the size of the model if None or 0
+        Returns:
+            threads: int, the threads reserved, capped by the budget
+        '''
+        given = bool(threads)
+        threads = min(threads or self.threads(model), self.cores)
+        self.acquire(threads)
+        try:
+            if given or not isinstance(model, CpSat):
+                model.setParam('Threads', threads)
+            yield threads
+        finally:
+            self.release(threads)
+
+    def acquire(self, threads):
+        '''
+        Take threads from the budget, waiting while it is short. For a caller splitting them over solves of its own
+        '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.free.value >= threads)
+            self.free.value -= threads
+
+    def release(self, threads):
+        with self.condition:
+            self.free.value += threads
+            self.condition.notify_all()
+
+scheduler = None
+
+def install(shared):
+    '''
+    Use a scheduler in this process, the initializer of the worker pools
+    '''
+    global scheduler
+    scheduler = shared
+
+def current():
+    '''
+    Returns:
+        scheduler: the installed scheduler, a scheduler of all cores of the machine if none is installed
+    '''
+    global scheduler
+    if scheduler is None:
+        scheduler = Scheduler()
+    return scheduler
@@ -1,14 +1,60 @@
 import os
+import itertools
+import collections
 import numpy as np
+from functools import lru_cache
 from puzzle import Puzzle, PuzzleParser
+from backend import quicksum
+from codec import decode, numbers
 from argparse import ArgumentParser
 from online import fetch, submit, hall
-import gurobipy as gp
 from gurobipy import GRB
 
+CACHE = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+TABLES = os.environ.get('SKYSCRAPERS_TABLES', os.path.join(CACHE, 'skyscrapers'))
+MAX_VIEWS = 9
+
+@lru_cache(maxsize=None)
+def views(n):
+    '''
+    All permutations of 1..n with the number of buildings visible from the left and the right, kept in TABLES once
+    computed. Boards larger than MAX_VIEWS raise ValueError, the 10! permutations already take 0.6 GB to enumerate
+    '''
+    if n > MAX_VIEWS:
+        raise ValueError(f'The permutation tables go up to {MAX_VIEWS}x{MAX_VIEWS}, got {n}x{n}')
+    path = os.path.join(TABLES, f'views{n}.npz')
+    if os.path.exists(path):
+        try:
+            with np.load(path) as f:
+                return f['perms'], f['left'], f['right']
+        except (OSError, ValueError, KeyError):
+            pass
+    perms = np.array(list(itertools.permutations(range(1, n+1))), dtype=np.int8)
+    left = (perms == np.maximum.accumulate(perms, axis=1)).sum(axis=1).astype(np.int8)
+    right = (perms[:, ::-1] == np.maximum.accumulate(perms[:, ::-1], axis=1)).sum(axis=1).astype(np.int8)
+    try:
+        os.makedirs(TABLES, exist_ok=True)
+        temp = f'{path}.{os.getpid()}'
+        with open(temp, 'wb') as f:
+            np.savez(f, perms=perms, left=left, right=right)
+        os.replace(temp, path)
+    except OSError:
+        pass
+    return perms, left, right
+
+@lru_cache(maxsize=None)
+def patterns(n, left, right):
+    '''
+    The permutations of 1..n seeing left buildings from the left and right from the right, 0 for no clue
+    '''
+    perms, l, r = views(n)
+    return perms[((l == left) | (left == 0)) & ((r == right) | (right == 0))]
+
 class Skyscrapers(Puzzle):
-    def __init__(self, input, name='Skyscrapers', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(input, name, check, solve, strategy, debug)
+    template_attrs = ('ans', 'cmp', 'visible')
+
+    def __init__(self, input, name='Skyscrapers', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(input, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
 
     def init_board(self):
         self.ans = self.model.addVars(self.n, self.n, vtype=GRB.INTEGER, lb=1, ub=self.n, name='ans')
@@ -38,32 +84,29 @@ class Skyscrapers(Puzzle):
         board = ''
         if ',' in task:
             task, board = task.split(',')
-        nums = task.split('/')
-        nums = [x if x.isdigit() else '.' for x in nums]
+        nums = [int(x) if x.isdigit() else 0 for x in task.split('/')]
         if len(nums) % 4:
             raise ValueError(f'Invalid length of task: {len(nums)}')
-        n = len(nums) // 4
-        res = 'u' + ''.join(nums[:n]) + '\n'
-        res += 'd' + ''.join(nums[n:2*n]) + '\n'
-        res += 'l' + ''.join(nums[2*n:3*n]) + '\n'
-        res += 'r' + ''.join(nums[3*n:]) + '\n'
-        if board:
-            board = board.strip().replace('_', '')
-            for i in range(26):
-                board = board.replace(chr(ord('a') + i), '.'*(i+1))
-            res += board
-        return self.parse(res)
+        self.n = len(nums) // 4
+        self.board = {d: nums[k*self.n:(k+1)*self.n] for k, d in enumerate('udlr')}
+        self.board['b'] = np.zeros((self.n, self.n), dtype=int)
+        if board.strip():
+            cells = decode(board.strip(), digits=1)
+            if len(cells) != self.n * self.n:
+                raise ValueError(f'Invalid length of board, expect {self.n*self.n}, got {len(cells)}')
+            self.board['b'] = cells.reshape(self.n, self.n)
+        return self.board
     
     def parse_from_file(self, file):
         with open(file, 'r') as f:
             raw = f.read()
         return self.parse(raw)
+
+    def features(self):
+        clues = sum(1 for d in 'udlr' for x in self.board[d] if x)
+        return {'size': self.n, 'clues': clues / (4 * self.n), 'given': float(np.count_nonzero(self.board['b'])) / self.n ** 2}
     
     def strategy_common(self):
-        for i in range(self.n):
-            for j in range(self.n):
-                if self.board['b'][i, j]:
-                    self.model.addConstr(self.ans[i, j] == self.board['b'][i, j])
         self.cmp = self.model.addVars([(i, j, x, y) for i in range(self.n) for j in range(self.n) for x in range(self.n) for y in range(self.n) 
                                        if (i == x and j != y) or (i != x and j == y)], vtype=GRB.BINARY, name='cmp')
         for i in range(self.n):
@@ -71,27 +114,121 @@ class Skyscrapers(Puzzle):
                 for x in range(self.n):
                     for y in range(self.n):
                         if (i == x and j != y) or (i != x and j == y):
-                            self.model.addConstr((self.cmp[i, j, x, y] == 1) >> (self.ans[i, j] >= self.ans[x, y]+1))
-                            self.model.addConstr((self.cmp[i, j, x, y] == 0) >> (self.ans[i, j] <= self.ans[x, y]-1))
+                            self.model.addGenConstrIndicator(self.cmp[i, j, x, y], True, self.ans[i, j] >= self.ans[x, y]+1)
+                            self.model.addGenConstrIndicator(self.cmp[i, j, x, y], False, self.ans[i, j] <= self.ans[x, y]-1)
         self.visible = self.model.addVars([(i, j, d) for i in range(self.n) for j in range(self.n) for d in ['u', 'd', 'l', 'r']], vtype=GRB.BINARY, name='visible')
         for i in range(self.n):
             for j in range(self.n):
-                self.model.addConstr(self.visible[i, j, 'u'] == gp.and_(self.cmp[i, j, k, j] for k in range(i)))
-                self.model.addConstr(self.visible[i, j, 'd'] == gp.and_(self.cmp[i, j, k, j] for k in range(i+1, self.n)))
-                self.model.addConstr(self.visible[i, j, 'l'] == gp.and_(self.cmp[i, j, i, k] for k in range(j)))
-                self.model.addConstr(self.visible[i, j, 'r'] == gp.and_(self.cmp[i, j, i, k] for k in range(j+1, self.n)))
+                self.model.addGenConstrAnd(self.visible[i, j, 'u'], [self.cmp[i, j, k, j] for k in range(i)])
+                self.model.addGenConstrAnd(self.visible[i, j, 'd'], [self.cmp[i, j, k, j] for k in range(i+1, self.n)])
+                self.model.addGenConstrAnd(self.visible[i, j, 'l'], [self.cmp[i, j, i, k] for k in range(j)])
+                self.model.addGenConstrAnd(self.visible[i, j, 'r'], [self.cmp[i, j, i, k] for k in range(j+1, self.n)])
     
-    def strategy_default(self):
+    def structure_default(self):
         self.strategy_common()
+
+    def clues_default(self):
+        cells = [(i, j) for i in range(self.n) for j in range(self.n) if self.board['b'][i, j]]
+        self.fix([self.ans[c] for c in cells], [self.board['b'][c] for c in cells])
         for i in range(self.n):
             if self.board['u'][i]:
-                self.model.addConstr(gp.quicksum(self.visible[j, i, 'u'] for j in range(self.n)) == self.board['u'][i])
+                self.model.addConstr(quicksum(self.visible[j, i, 'u'] for j in range(self.n)) == self.board['u'][i])
             if self.board['d'][i]:
-                self.model.addConstr(gp.quicksum(self.visible[j, i, 'd'] for j in range(self.n)) == self.board['d'][i])
+                self.model.addConstr(quicksum(self.visible[j, i, 'd'] for j in range(self.n)) == self.board['d'][i])
             if self.board['l'][i]:
-                self.model.addConstr(gp.quicksum(self.visible[i, j, 'l'] for j in range(self.n)) == self.board['l'][i])
+                self.model.addConstr(quicksum(self.visible[i, j, 'l'] for j in range(self.n)) == self.board['l'][i])
             if self.board['r'][i]:
-                self.model.addConstr(gp.quicksum(self.visible[i, j, 'r'] for j in range(self.n)) == self.board['r'][i])
+                self.model.addConstr(quicksum(self.visible[i, j, 'r'] for j in range(self.n)) == self.board['r'][i])
+
+    def strategy_default(self):
+        self.structure_default()
+        self.clues_default()
+
+    def strategy_pattern(self):
+        '''
+        One binary per permutation of a row or column fitting its clues, from the tables of views(), so boards up to
+        MAX_VIEWS only
+        '''
+        self.pattern = {}
+        for d, first, last in [('row', 'l', 'r'), ('col', 'u', 'd')]:
+            for i in range(self.n):
+                cells = [(i, j) if d == 'row' else (j, i) for j in range(self.n)]
+                given = np.array([self.board['b'][c] for c in cells])
+                pats = patterns(self.n, self.board[first][i], self.board[last][i])
+                pats = pats[np.all((given == 0) | (pats == given), axis=1)]
+                self.pattern[d, i] = self.model.addVars(len(pats), vtype=GRB.BINARY, name=f'pattern_{d}_{i}')
+                self.model.addConstr(quicksum(self.pattern[d, i].values()) == 1)
+                for j, c in enumerate(cells):
+                    self.model.addConstr(self.ans[c] == quicksum(int(pats[k, j]) * self.pattern[d, i][k] for k in range(len(pats))))
+
+    def strategy_backtrack(self):
+        '''
+        Solve without a model: every row and column keeps the permutations of its clues that fit the domains of its
+        cells, and the domains keep the values left in those permutations, until neither changes. Then the line with
+        the fewest permutations is branched on, up to self.limit solutions.
+        '''
+        self.native = True
+        n = self.n
+        lines = [patterns(n, self.board['l'][i], self.board['r'][i]) for i in range(n)]
+        lines += [patterns(n, self.board['u'][i], self.board['d'][i]) for i in range(n)]
+        domain = np.ones((n, n, n+1), dtype=bool)
+        domain[:, :, 0] = False
+        for i, j in zip(*np.nonzero(self.board['b'])):
+            domain[i, j] = False
+            domain[i, j, self.board['b'][i, j]] = True
+        self.solutions = []
+        self.backtrack(lines, domain)
+
+    def propagate(self, lines, domain):
+        '''
+        Narrow the permutations of the lines and the domains of the cells in place, rows first then columns
+        Returns:
+            feasible: bool, False if a line has no permutation left
+        '''
+        n = self.n
+        positions = np.arange(n)
+        queue = collections.deque(range(2 * n))
+        queued = [True] * (2 * n)
+        while queue:
+            k = queue.popleft()
+            queued[k] = False
+            cells = domain[k] if k < n else domain[:, k - n]
+            perms = lines[k]
+            keep = cells[positions, perms].all(axis=1)
+            if not keep.all():
+                perms = lines[k] = perms[keep]
+                if not len(perms):
+                    return False
+            left = np.zeros_like(cells)
+            left[np.broadcast_to(positions, perms.shape), perms] = True
+            for j in np.flatnonzero((cells & ~left).any(axis=1)):
+                cross = j + n if k < n else j
+                if not queued[cross]:
+                    queued[cross] = True
+                    queue.append(cross)
+            cells &= left
+        return True
+
+    def backtrack(self, lines, domain):
+        if not self.propagate(lines, domain):
+            return
+        sizes = [len(perms) for perms in lines]
+        if max(sizes) == 1:
+            self.solutions.append(np.array([perms[0] for perms in lines[:self.n]], dtype=int))
+            return
+        k = min((size, k) for k, size in enumerate(sizes) if size > 1)[1]
+        for perm in lines[k]:
+            branch = list(lines)
+            branch[k] = perm[None]
+            self.backtrack(branch, domain.copy())
+            if len(self.solutions) >= self.limit:
+                return
+
+    def strategy_bank(self):
+        return {'default': self.strategy_default, 'pattern': self.strategy_pattern, 'backtrack': self.strategy_backtrack}
+
+    def init_nogood(self):
+        return self.nogood_integer()
 
     def init_clone(self):
         self.clone.gr = self.clone.model.addVars(self.n, self.n, vtype=GRB.BINARY, name='flag')
@@ -99,9 +236,9 @@ class Skyscrapers(Puzzle):
         for i in range(self.n):
             for j in range(self.n):
                 self.clone.model.addConstr(self.clone.gr[i, j] + self.clone.le[i, j] <= 1)
-                self.clone.model.addConstr((self.clone.gr[i, j] == 1) >> (self.clone.ans[i, j] >= round(self.ans[i, j].X) + 1))
-                self.clone.model.addConstr((self.clone.le[i, j] == 1) >> (self.clone.ans[i, j] <= round(self.ans[i, j].X) - 1))
-        self.clone.model.addConstr(self.clone.gr.sum() + self.clone.le.sum() >= 1)
+                self.clone.model.addGenConstrIndicator(self.clone.gr[i, j], True, self.clone.ans[i, j] >= self.value(i, j) + 1)
+                self.clone.model.addGenConstrIndicator(self.clone.le[i, j], True, self.clone.ans[i, j] <= self.value(i, j) - 1)
+        self.clone.model.addConstr(quicksum(self.clone.gr.values()) + quicksum(self.clone.le.values()) >= 1)
     
     def pretty(self):
         try:
@@ -112,7 +249,7 @@ class Skyscrapers(Puzzle):
                 res += str(self.board['l'][i]) if self.board['l'][i] else '*'
                 res += ' '
                 for j in range(self.n):
-                    t = round(self.ans[i, j].X)
+                    t = self.value(i, j)
                     res += str(t) + ' '
                 res += str(self.board['r'][i]) if self.board['r'][i] else '*'
                 res += '\n'
@@ -128,11 +265,7 @@ class Skyscrapers(Puzzle):
         
     def __str__(self):
         try:
-            res = ''
-            for i in range(self.n):
-                for j in range(self.n):
-                    res += str(round(self.ans[i, j].X)) + ','
-            return res
+            return numbers(self.solution_array())
         except Exception as e:
             if self.debug:
                 raise e
@@ -142,8 +275,13 @@ class Color(Skyscrapers):
     '''
     https://puzzle.university/puzzle/classical-influences-on-modern-architecture.html
     '''
-    def __init__(self, file, name='Color Skyscrapers', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(file, name, check, solve, strategy, debug)
+    def __init__(self, file, name='Color Skyscrapers', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        if cache is not None:
+            raise ValueError('Color Skyscrapers cannot be cached, its solution includes the colors')
+        super().__init__(file, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
+
+    def template_key(self):
+        return None
 
     def init_board(self):
         super().init_board()
@@ -169,32 +307,36 @@ class Color(Skyscrapers):
         self.strategy_common()
         self.b = self.model.addVars(self.colors, range(1, self.n+1), vtype=GRB.BINARY, name='b')
         for i in self.colors:
-            self.model.addConstr(gp.quicksum(self.b[i, j] for j in range(1, self.n+1)) == 1)
+            self.model.addConstr(quicksum(self.b[i, j] for j in range(1, self.n+1)) == 1)
             for j in range(1, self.n+1):
-                self.model.addConstr((self.b[i, j] == 1) >> (self.color[i] == j))
+                self.model.addGenConstrIndicator(self.b[i, j], True, self.color[i] == j)
         for j in range(1, self.n+1):
-            self.model.addConstr(gp.quicksum(self.b[i, j] for i in self.colors) == 1)
+            self.model.addConstr(quicksum(self.b[i, j] for i in self.colors) == 1)
         for i in range(self.n):
-            self.model.addConstr(gp.quicksum(self.visible[j, i, 'u'] for j in range(self.n)) == self.color[self.board['u'][i]])
-            self.model.addConstr(gp.quicksum(self.visible[j, i, 'd'] for j in range(self.n)) == self.color[self.board['d'][i]])
-            self.model.addConstr(gp.quicksum(self.visible[i, j, 'l'] for j in range(self.n)) == self.color[self.board['l'][i]])
-            self.model.addConstr(gp.quicksum(self.visible[i, j, 'r'] for j in range(self.n)) == self.color[self.board['r'][i]])
+            self.model.addConstr(quicksum(self.visible[j, i, 'u'] for j in range(self.n)) == self.color[self.board['u'][i]])
+            self.model.addConstr(quicksum(self.visible[j, i, 'd'] for j in range(self.n)) == self.color[self.board['d'][i]])
+            self.model.addConstr(quicksum(self.visible[i, j, 'l'] for j in range(self.n)) == self.color[self.board['l'][i]])
+            self.model.addConstr(quicksum(self.visible[i, j, 'r'] for j in range(self.n)) == self.color[self.board['r'][i]])
+
+    def strategy_bank(self):
+        return {'default': self.strategy_default}
 
     def pretty(self):
         try:
+            colors = dict(zip(self.colors, np.rint(self.model.getAttr('X', [self.color[c] for c in self.colors])).astype(int)))
             res = '  '
-            res += ' '.join(str(round(self.color[x].X)) for x in self.board['u'])
+            res += ' '.join(str(colors[x]) for x in self.board['u'])
             res += '\n'
             for i in range(self.n):
-                res += str(round(self.color[self.board['l'][i]].X))
+                res += str(colors[self.board['l'][i]])
                 res += ' '
                 for j in range(self.n):
-                    t = round(self.ans[i, j].X)
+                    t = self.value(i, j)
                     res += str(t) + ' '
-                res += str(round(self.color[self.board['r'][i]].X))
+                res += str(colors[self.board['r'][i]])
                 res += '\n'
             res += '  '
-            res += ' '.join(str(round(self.color[x].X)) for x in self.board['d'] )
+            res += ' '.join(str(colors[x]) for x in self.board['d'] )
             if self.check:
                 res += '\n' + self.unique
             return res
@@ -207,6 +349,8 @@ class Color(Skyscrapers):
         raise NotImplementedError
     
 class SkyscrapersParser(PuzzleParser):
+    strategy_help = PuzzleParser.strategy_help + f', pattern and backtrack take boards up to {MAX_VIEWS}x{MAX_VIEWS}'
+
     def __init__(self, description='Skyscrapers Solver'):
         super().__init__(description)
     
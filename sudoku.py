@@ -1,14 +1,18 @@
 import os
 import numpy as np
 from puzzle import Puzzle, PuzzleParser
+from backend import quicksum
+from codec import decode, numbers
+from exactcover import exact_cover
 from argparse import ArgumentParser
 from online import fetch, submit, hall
-import gurobipy as gp
 from gurobipy import GRB
 
 class Sudoku(Puzzle):
-    def __init__(self, input, name='Sudoku', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(input, name, check, solve, strategy, debug)
+    template_attrs = ('ans', 'b')
+
+    def __init__(self, input, name='Sudoku', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(input, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
     
     def init_board(self):
         self.ans = self.model.addVars(self.n, self.n, vtype=GRB.INTEGER, lb=1, ub=self.n, name='ans')
@@ -24,30 +28,11 @@ class Sudoku(Puzzle):
             self.n = 16
         else:
             raise ValueError(f'Invalid number of entries, got {len(nums)}')
-        self.board = np.zeros((self.n, self.n), dtype=int)
-        for i in range(self.n):
-            for j in range(self.n):
-                self.board[i, j] = nums[i*self.n+j]
+        self.board = np.array(nums, dtype=int).reshape(self.n, self.n)
         return self.board
 
     def parse_from_task(self, task):
-        nums = []
-        while task:
-            if len(task) >= 2 and task[:2].isdigit():
-                nums.append(int(task[:2]))
-                task = task[2:]
-            elif task[0].isdigit():
-                nums.append(int(task[0]))
-                task = task[1:]
-            elif task[0].isalpha():
-                cnt = ord(task[0]) - ord('a') + 1
-                nums += [0] * cnt
-                task = task[1:]
-            elif task[0] == '_':
-                task = task[1:]
-            else:
-                raise ValueError(f"Invalid character '{task[0]}'")
-        return self.parse(nums)
+        return self.parse(decode(task))
     
     def parse_from_file(self, file):
         with open(file, 'r') as f:
@@ -55,6 +40,9 @@ class Sudoku(Puzzle):
         nums = [x for x in raw if not x.isspace()]
         nums = [int(x) if x.isdigit() else ord(x) - ord('A') + 10 if x.isalpha() else 0 for x in nums]
         return self.parse(nums)
+
+    def features(self):
+        return {'size': self.n, 'clues': float(np.count_nonzero(self.board)) / self.board.size}
     
     def xy(self):
         if self.n == 6:
@@ -71,18 +59,129 @@ class Sudoku(Puzzle):
             y = 4
         return x, y
 
-    def strategy_inequality(self):
-        self.model.addConstrs(self.ans[i, j] == self.board[i, j] for i in range(self.n) for j in range(self.n) if self.board[i, j] != 0)
+    def canonical(self):
+        '''
+        The board under the symmetries keeping the boxes, all rotations and reflections for square boxes and
+        the half turn and the reflections otherwise, with the digits relabeled in order of first appearance.
+        The smallest image is the key, so equivalent puzzles share a cached solution.
+        '''
+        x, y = self.xy()
+        best = None
+        for k in (range(4) if x == y else (0, 2)):
+            for flip in (False, True):
+                grid = np.rot90(np.flipud(self.board) if flip else self.board, k)
+                order = list(dict.fromkeys(int(v) for v in grid.flat if v))
+                order += [v for v in range(1, self.n+1) if v not in order]
+                relabel = np.zeros(self.n+1, dtype=int)
+                relabel[order] = range(1, self.n+1)
+                image = relabel[grid].flatten().tolist()
+                if best is None or image < best[0]:
+                    best = (image, k, flip, relabel)
+        image, k, flip, relabel = best
+        inverse = np.zeros(self.n+1, dtype=int)
+        inverse[relabel] = range(self.n+1)
+        def forward(grid):
+            return relabel[np.rot90(np.flipud(grid) if flip else grid, k)]
+        def backward(grid):
+            grid = np.rot90(inverse[grid], -k)
+            return np.flipud(grid) if flip else grid
+        return ','.join(map(str, image)), forward, backward
+
+    def units(self):
+        '''
+        Returns:
+            units: ndarray of shape (units, n), the flat cells of every row, column and box
+        '''
+        x, y = self.xy()
+        cells = np.arange(self.n * self.n).reshape(self.n, self.n)
+        boxes = [cells[i*y:(i+1)*y, j*x:(j+1)*x].ravel() for i in range(x) for j in range(y)]
+        return np.vstack([cells, cells.T] + boxes)
+
+    def deduce(self):
+        '''
+        Narrow the candidates of the board by naked singles, hidden singles and locked candidates to a fixpoint, every
+        rule applied to all units at once on boolean masks. Locked candidates hold between any two units sharing more
+        than one cell, a box with a line or a diagonal.
+        Returns:
+            candidates: bool ndarray of shape (n, n, n), whether digit k+1 can still go in cell (i, j), None if the
+            board is contradictory
+        '''
+        n = self.n
+        units = self.units()
+        member = np.zeros((n * n, len(units)), dtype=int)
+        member[units, np.arange(len(units))[:, None]] = 1
+        first, second = np.nonzero((member.T @ member > 1) & ~np.eye(len(units), dtype=bool))
+        inside = member[:, first] & member[:, second]
+        outside = member[:, second] & ~inside
+        given = self.board.ravel()
+        cand = np.ones((n * n, n), dtype=bool)
+        cand[given > 0] = False
+        cand[np.flatnonzero(given), given[given > 0] - 1] = True
+        while True:
+            before = cand.copy()
+            single = cand.sum(1) == 1
+            placed = member.T @ (cand & single[:, None])
+            if not cand.any(1).all() or (placed > 1).any():
+                return None
+            cand &= ~((member @ placed > 0) & ~single[:, None])
+            counts = member.T @ cand
+            if (counts == 0).any():
+                return None
+            hidden = np.zeros_like(cand)
+            u, d = np.nonzero(counts == 1)
+            hidden[units[u, cand[units[u], d[:, None]].argmax(1)], d] = True
+            if (hidden.sum(1) > 1).any():
+                return None
+            cells = hidden.any(1)
+            cand[cells] = hidden[cells]
+            counts = member.T @ cand
+            shared = inside.T @ cand
+            locked = (shared == counts[first]) & (shared > 0)
+            cand &= ~(outside @ locked > 0)
+            if (cand == before).all():
+                return cand.reshape(n, n, n)
+
+    def init_model(self):
+        '''
+        Deduce the candidates before the model is built, a board solved or refuted by logic alone needs no model
+        and its solution is unique
+        '''
+        if self.strategy in ['default', 'inequality']:
+            self.candidates = self.deduce()
+            if self.candidates is None or self.candidates.sum(2).max() == 1:
+                self.native = True
+                self.complete = True
+                self.solutions = [] if self.candidates is None else [self.candidates.argmax(2) + 1]
+                self.init_board()
+                return
+            self.stats['deduced'] = int((self.candidates.sum(2) == 1).sum()) - int(np.count_nonzero(self.board))
+        super().init_model()
+
+    def clues_default(self):
+        '''
+        Fix the cells decided by logic, and on the binary model drop the eliminated digits through their bounds
+        '''
+        grid = np.where(self.candidates.sum(2) == 1, self.candidates.argmax(2) + 1, 0)
+        cells = [(int(i), int(j)) for i, j in zip(*np.nonzero(grid))]
+        self.fix([self.ans[c] for c in cells], [grid[c] for c in cells])
+        if self.strategy == 'default':
+            eliminated = [self.b[int(i), int(j), int(k) + 1] for i, j, k in zip(*np.nonzero(~self.candidates))]
+            self.model.setAttr('UB', eliminated, [0] * len(eliminated))
+
+    def clues_inequality(self):
+        self.clues_default()
+
+    def structure_inequality(self):
         self.b = {}
         for i in range(self.n):
             for j in range(self.n):
                 for k in range(j+1, self.n):
                     self.b[i, j, i, k] = self.model.addVar(vtype=GRB.BINARY, name=f'b_{i}_{j}_{i}_{k}')
                     self.b[j, i, k, i] = self.model.addVar(vtype=GRB.BINARY, name=f'b_{j}_{i}_{k}_{i}')
-                    self.model.addConstr((self.b[i, j, i, k] == 0) >> (self.ans[i, j] <= self.ans[i, k] - 1))
-                    self.model.addConstr((self.b[i, j, i, k] == 1) >> (self.ans[i, j] >= self.ans[i, k] + 1))
-                    self.model.addConstr((self.b[j, i, k, i] == 0) >> (self.ans[j, i] <= self.ans[k, i] - 1))
-                    self.model.addConstr((self.b[j, i, k, i] == 1) >> (self.ans[j, i] >= self.ans[k, i] + 1))
+                    self.model.addGenConstrIndicator(self.b[i, j, i, k], False, self.ans[i, j] <= self.ans[i, k] - 1)
+                    self.model.addGenConstrIndicator(self.b[i, j, i, k], True, self.ans[i, j] >= self.ans[i, k] + 1)
+                    self.model.addGenConstrIndicator(self.b[j, i, k, i], False, self.ans[j, i] <= self.ans[k, i] - 1)
+                    self.model.addGenConstrIndicator(self.b[j, i, k, i], True, self.ans[j, i] >= self.ans[k, i] + 1)
         x, y = self.xy()
         for i in range(x):
             for j in range(y):
@@ -93,47 +192,75 @@ class Sudoku(Puzzle):
                         x2, y2 = pairs[l]
                         if not (x1, y1, x2, y2) in self.b:
                             self.b[x1, y1, x2, y2] = self.model.addVar(vtype=GRB.BINARY, name=f'b_{x1}_{y1}_{x2}_{y2}')
-                            self.model.addConstr((self.b[x1, y1, x2, y2] == 0) >> (self.ans[x1, y1] <= self.ans[x2, y2] - 1))
-                            self.model.addConstr((self.b[x1, y1, x2, y2] == 1) >> (self.ans[x1, y1] >= self.ans[x2, y2] + 1))
+                            self.model.addGenConstrIndicator(self.b[x1, y1, x2, y2], False, self.ans[x1, y1] <= self.ans[x2, y2] - 1)
+                            self.model.addGenConstrIndicator(self.b[x1, y1, x2, y2], True, self.ans[x1, y1] >= self.ans[x2, y2] + 1)
+
+    def strategy_inequality(self):
+        self.structure_inequality()
+        self.clues_inequality()
     
-    def strategy_default(self):
-        self.model.addConstrs(self.ans[i, j] == self.board[i, j] for i in range(self.n) for j in range(self.n) if self.board[i, j] != 0)
+    def structure_default(self):
         self.b = self.model.addVars(self.n, self.n, range(1, self.n+1), vtype=GRB.BINARY, name='b')
         for i in range(self.n):
             for j in range(self.n):
-                self.model.addConstr(gp.quicksum(self.b[i, j, k] for k in range(1, self.n+1)) == 1)
+                self.model.addConstr(quicksum(self.b[i, j, k] for k in range(1, self.n+1)) == 1)
                 for k in range(1, self.n+1):
-                    self.model.addConstr((self.b[i, j, k] == 1) >> (self.ans[i, j] == k))
+                    self.model.addGenConstrIndicator(self.b[i, j, k], True, self.ans[i, j] == k)
         for i in range(self.n):
             for k in range(1, self.n+1):
-                self.model.addConstr(gp.quicksum(self.b[i, j, k] for j in range(self.n)) == 1)
-                self.model.addConstr(gp.quicksum(self.b[j, i, k] for j in range(self.n)) == 1)
+                self.model.addConstr(quicksum(self.b[i, j, k] for j in range(self.n)) == 1)
+                self.model.addConstr(quicksum(self.b[j, i, k] for j in range(self.n)) == 1)
         x, y = self.xy()
         for i in range(x):
             for j in range(y):
                 pairs = [(i*y+k, j*x+l) for k in range(y) for l in range(x)]
                 for k in range(1, self.n+1):
-                    self.model.addConstr(gp.quicksum(self.b[p[0], p[1], k] for p in pairs) == 1)
+                    self.model.addConstr(quicksum(self.b[p[0], p[1], k] for p in pairs) == 1)
+
+    def strategy_default(self):
+        self.structure_default()
+        self.clues_default()
+
+    def cover(self, i, j, k):
+        x, y = self.xy()
+        return [('cell', i, j), ('row', i, k), ('col', j, k), ('box', i // y, j // x, k)]
+
+    def strategy_dlx(self):
+        self.native = True
+        rows = {(i, j, k): self.cover(i, j, k) for i in range(self.n) for j in range(self.n) for k in range(1, self.n+1)}
+        columns = set(c for cover in rows.values() for c in cover)
+        givens = [(i, j, self.board[i, j]) for i in range(self.n) for j in range(self.n) if self.board[i, j] != 0]
+        self.solutions = []
+        for solution in exact_cover(columns, rows, givens, limit=self.limit):
+            grid = np.zeros((self.n, self.n), dtype=int)
+            for i, j, k in solution:
+                grid[i, j] = k
+            self.solutions.append(grid)
 
     def strategy_bank(self):
-        return {'default': self.strategy_default, 'inequality': self.strategy_inequality}
+        return {'default': self.strategy_default, 'inequality': self.strategy_inequality, 'dlx': self.strategy_dlx}
     
+    def init_nogood(self):
+        if self.strategy != 'default':
+            return self.nogood_integer()
+        return [self.model.addConstr(quicksum(self.b[i, j, self.value(i, j)] for i in range(self.n) for j in range(self.n)) <= self.n * self.n - 1)]
+
     def init_clone(self):
         self.clone.gr = self.clone.model.addVars(self.n, self.n, vtype=GRB.BINARY, name='gr')
         self.clone.le = self.clone.model.addVars(self.n, self.n, vtype=GRB.BINARY, name='le')
         for i in range(self.n):
             for j in range(self.n):
                 self.clone.model.addConstr(self.clone.gr[i, j] + self.clone.le[i, j] <= 1)
-                self.clone.model.addConstr((self.clone.gr[i, j] == 1) >> (self.clone.ans[i, j] >= round(self.ans[i, j].X) + 1))
-                self.clone.model.addConstr((self.clone.le[i, j] == 1) >> (self.clone.ans[i, j] <= round(self.ans[i, j].X) - 1))
-        self.clone.model.addConstr(self.clone.gr.sum() + self.clone.le.sum() >= 1)
+                self.clone.model.addGenConstrIndicator(self.clone.gr[i, j], True, self.clone.ans[i, j] >= self.value(i, j) + 1)
+                self.clone.model.addGenConstrIndicator(self.clone.le[i, j], True, self.clone.ans[i, j] <= self.value(i, j) - 1)
+        self.clone.model.addConstr(quicksum(self.clone.gr.values()) + quicksum(self.clone.le.values()) >= 1)
     
     def pretty(self):
         try:
             res = ''
             for i in range(self.n):
                 for j in range(self.n):
-                    res += str(round(self.ans[i, j].X)) + ' '
+                    res += str(self.value(i, j)) + ' '
                 res += '\n'
             if self.check:
                 res += '\n' + self.unique
@@ -145,28 +272,36 @@ class Sudoku(Puzzle):
 
     def __str__(self):
         try:
-            res = ''
-            for i in range(self.n):
-                for j in range(self.n):
-                    res += str(round(self.ans[i, j].X)) + ','
-            return res
+            return numbers(self.solution_array())
         except Exception as e:
             if self.debug:
                 raise e
             return f'Error: {e}'
 
 class Diagonal(Sudoku):
-    def __init__(self, file, name='Diagonal Sudoku', check=False, solve=True, strategy='default', debug=False):
-        super().__init__(file, name, check, solve, strategy, debug)
+    def __init__(self, file, name='Diagonal Sudoku', check=False, solve=True, strategy='default', debug=False, params=None, cache=None, profile=False, backend='gurobi', warm=None):
+        super().__init__(file, name, check, solve, strategy, debug, params, cache, profile, backend, warm)
 
-    def strategy_default(self):
-        super().strategy_default()
+    def structure_default(self):
+        super().structure_default()
         for k in range(1, self.n+1):
-            self.model.addConstr(gp.quicksum(self.b[i, i, k] for i in range(self.n)) == 1)
-            self.model.addConstr(gp.quicksum(self.b[i, self.n-i-1, k] for i in range(self.n)) == 1)
+            self.model.addConstr(quicksum(self.b[i, i, k] for i in range(self.n)) == 1)
+            self.model.addConstr(quicksum(self.b[i, self.n-i-1, k] for i in range(self.n)) == 1)
+
+    def units(self):
+        cells = np.arange(self.n * self.n).reshape(self.n, self.n)
+        return np.vstack([super().units(), cells.diagonal(), np.fliplr(cells).diagonal()])
+
+    def cover(self, i, j, k):
+        res = super().cover(i, j, k)
+        if i == j:
+            res.append(('diag', k))
+        if i + j == self.n - 1:
+            res.append(('anti', k))
+        return res
 
     def strategy_bank(self):
-        return {'default': self.strategy_default}
+        return {'default': self.strategy_default, 'dlx': self.strategy_dlx}
 
 class SudokuParser(PuzzleParser):
     def __init__(self, description='Sudoku Solver'):
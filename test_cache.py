@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from cache import Cache
+from codec import decode, encode
+from nurikabe import Nurikabe
+from skyscrapers import Color
+from sudoku import Sudoku, Diagonal
+
+@pytest.fixture
+def cache(tmp_path):
+    return Cache(str(tmp_path / 'solutions.db'))
+
+@pytest.mark.parametrize('cls, file', [(Sudoku, 'example/sudoku.txt'), (Sudoku, 'example/sudoku6.txt'), (Diagonal, 'example/diagonal.txt')])
+def test_hit_matches_default(cache, cls, file):
+    solved = cls(file, cache=cache)
+    assert not solved.cached
+    hit = cls(file, cache=cache)
+    assert hit.cached
+    assert str(hit) == str(solved) == str(cls(file))
+
+def test_rotated_relabeled_sudoku(cache):
+    solved = Sudoku('example/sudoku.txt', cache=cache)
+    relabel = np.array([0, 5, 3, 9, 1, 7, 2, 8, 6, 4])
+    move = lambda grid: relabel[np.rot90(np.fliplr(grid))]
+    task = encode(move(solved.board).flatten())
+    hit = Sudoku(task, cache=cache)
+    assert hit.cached
+    assert np.array_equal(hit.solution_array(), move(solved.solution_array()))
+    assert str(hit) == str(Sudoku(task))
+
+def test_rotated_nurikabe(cache):
+    task = 'd3b3h1f1a'
+    solved = Nurikabe(task, cache=cache)
+    assert not solved.cached
+    rotated = encode(np.rot90(decode(task).reshape(5, 5), 1).flatten())
+    hit = Nurikabe(rotated, cache=cache)
+    assert hit.cached
+    assert str(hit) == str(Nurikabe(rotated))
+
+def test_color_rejects_cache(cache):
+    with pytest.raises(ValueError):
+        Color('example/colorskyscrapers.txt', cache=cache)
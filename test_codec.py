@@ -0,0 +1,26 @@
+import random
+import pytest
+from codec import decode, encode, expand
+
+def test_decode():
+    assert decode('b3_4a12').tolist() == [0, 0, 3, 4, 0, 12]
+    assert decode('a12', digits=1, blank=-1).tolist() == [-1, 1, 2]
+
+def test_decode_rejects_other_characters():
+    for task in ['b3A4', 'b3.4', 'b3 4']:
+        with pytest.raises(ValueError):
+            decode(task)
+
+def test_round_trip():
+    rng = random.Random(0)
+    for _ in range(1000):
+        values = [rng.choice([0, 0, 0, rng.randint(1, 35)]) for _ in range(rng.randint(0, 400))]
+        assert decode(encode(values)).tolist() == values
+
+def test_round_trip_single_digits():
+    rng = random.Random(1)
+    for _ in range(1000):
+        digits = [rng.choice([-1, -1, rng.randint(0, 9)]) for _ in range(rng.randint(0, 400))]
+        task = encode(digits, blank=-1, separate=False)
+        assert decode(task, digits=1, blank=-1).tolist() == digits
+        assert expand(task) == ''.join('.' if v < 0 else str(v) for v in digits)
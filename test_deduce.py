@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from codec import encode
+from sudoku import Sudoku, Diagonal
+
+EXAMPLES = [(Sudoku, 'example/sudoku.txt'), (Sudoku, 'example/sudoku6.txt'),
+            (Diagonal, 'example/diagonal.txt'), (Diagonal, 'example/diagonal6.txt')]
+
+def givens(self):
+    n = self.n
+    cand = np.ones((n, n, n), dtype=bool)
+    i, j = np.nonzero(self.board)
+    cand[i, j] = False
+    cand[i, j, self.board[i, j] - 1] = True
+    return cand
+
+# the inequality model takes 20s on the 9x9 example
+@pytest.mark.parametrize('cls, file, strategy', [(cls, file, 'default') for cls, file in EXAMPLES] + [(Sudoku, 'example/sudoku6.txt', 'inequality')])
+def test_deduce_matches_default(monkeypatch, cls, file, strategy):
+    deduced = str(cls(file, strategy=strategy))
+    assert deduced == str(cls(file, strategy='dlx'))
+    monkeypatch.setattr(cls, 'deduce', givens)
+    assert deduced == str(cls(file, strategy=strategy))
+
+@pytest.mark.parametrize('cls, file', EXAMPLES)
+def test_deduce_keeps_every_solution(cls, file):
+    rng = np.random.default_rng(0)
+    solution = cls(file, strategy='dlx').solution_array()
+    for _ in range(20):
+        board = np.where(rng.random(solution.shape) < 0.35, solution, 0)
+        puzzle = cls(encode(board.flatten()), solve=False, strategy='dlx')
+        puzzle.limit = 3
+        puzzle.strategy_dlx()
+        candidates = puzzle.deduce()
+        for grid in puzzle.solutions:
+            assert np.take_along_axis(candidates, grid[..., None] - 1, 2).all()
+
+def test_deduce_refutes_contradiction():
+    board = Sudoku('example/sudoku.txt', solve=False).board.copy()
+    i, j = np.argwhere(board == 0)[0]
+    board[i, j] = board[i][board[i] > 0][0]
+    puzzle = Sudoku(encode(board.flatten()))
+    assert puzzle.deduce() is None
+    assert puzzle.status() == 'infeasible'
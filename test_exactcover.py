@@ -0,0 +1,22 @@
+import pytest
+from exactcover import exact_cover
+from sudoku import Sudoku, Diagonal
+
+EXAMPLES = [(Sudoku, 'example/sudoku.txt'), (Sudoku, 'example/sudoku6.txt'),
+            (Diagonal, 'example/diagonal.txt'), (Diagonal, 'example/diagonal6.txt')]
+
+def test_exact_cover():
+    rows = {'A': [1, 4, 7], 'B': [1, 4], 'C': [4, 5, 7], 'D': [3, 5, 6], 'E': [2, 3, 6, 7], 'F': [2, 7]}
+    assert [sorted(s) for s in exact_cover(range(1, 8), rows, limit=2)] == [['B', 'D', 'F']]
+    assert list(exact_cover(range(1, 8), rows, partial=['A'], limit=2)) == []
+
+@pytest.mark.parametrize('cls, file', EXAMPLES)
+def test_dlx_matches_default(cls, file):
+    dlx = cls(file, strategy='dlx', check=True)
+    assert str(dlx) == str(cls(file))
+    assert dlx.unique == 'The solution is unique'
+
+def test_dlx_reports_second_solution():
+    dlx = Sudoku('example/blank.txt', strategy='dlx', check=True)
+    assert dlx.status() == 'solved'
+    assert dlx.unique.startswith('The solution is not unique')
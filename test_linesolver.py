@@ -0,0 +1,70 @@
+import itertools
+import json
+import random
+import pytest
+from linesolver import solve_line, solve_bits
+from nonograms import Nonograms
+
+BENCH = [json.loads(line) for line in open('example/bench.jsonl') if '"nonograms"' in line]
+TASKS = [record['input'] for record in BENCH]
+NAMES = [f"{record['level']}-{record['index']}" for record in BENCH]
+
+def runs(cells):
+    '''
+    Returns:
+        starts: list, the start of every block of filled cells
+        clue: list, the block lengths, [0] for an empty line
+    '''
+    starts, clue = [], []
+    for p, v in enumerate(cells):
+        if v and (p == 0 or not cells[p-1]):
+            starts.append(p)
+            clue.append(0)
+        if v:
+            clue[-1] += 1
+    return starts, clue or [0]
+
+def brute(clue, line):
+    fits = [cells for cells in itertools.product([0, 1], repeat=len(line))
+            if runs(cells)[1] == clue and all(v == -1 or v == c for v, c in zip(line, cells))]
+    if not fits:
+        return None, None
+    res = [col[0] if len(set(col)) == 1 else -1 for col in zip(*fits)]
+    starts = [runs(cells)[0] for cells in fits]
+    return res, [(min(s), max(s)) for s in zip(*starts)]
+
+def test_solve_line_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(3000):
+        n = rng.randint(1, 9)
+        cells = [rng.randint(0, 1) for _ in range(n)]
+        clue = runs(cells)[1] if rng.random() < 0.8 else runs([rng.randint(0, 1) for _ in range(n)])[1]
+        line = [c if rng.random() < 0.3 else -1 for c in cells]
+        assert solve_line(clue, line) == brute(clue, line), (clue, line)
+
+def test_solve_bits_matches_solve_line():
+    rng = random.Random(1)
+    for _ in range(1000):
+        n = rng.randint(1, 9)
+        clue = runs([rng.randint(0, 1) for _ in range(n)])[1]
+        line = [rng.choice([-1, -1, 0, 1]) for _ in range(n)]
+        res, _ = solve_line(clue, line)
+        ones = sum(1 << p for p, v in enumerate(line) if v == 1)
+        zeros = sum(1 << p for p, v in enumerate(line) if v == 0)
+        bits = solve_bits(tuple(clue), n, ones, zeros)
+        if res is None:
+            assert bits is None
+        else:
+            assert bits == (sum(1 << p for p, v in enumerate(res) if v == 1), sum(1 << p for p, v in enumerate(res) if v == 0))
+
+@pytest.mark.parametrize('input', ['example/nonograms.txt'] + TASKS, ids=['example'] + NAMES)
+def test_line_matches_default(input):
+    # some bench boards have several solutions, so the solution sets are compared
+    line = {grid.tobytes() for grid in Nonograms(input, strategy='line').iter_solutions(5)}
+    default = {grid.tobytes() for grid in Nonograms(input, backend='cpsat').iter_solutions(5)}
+    assert len(line) == len(default)
+    if len(line) < 5:
+        assert line == default
+
+def test_line_counts_solutions():
+    assert Nonograms('1/1/1/1', strategy='line').count_solutions(3) == 2
@@ -0,0 +1,28 @@
+import json
+import numpy as np
+import pytest
+from nonograms import Nonograms
+
+TASKS = [json.loads(line)['input'] for line in open('example/bench.jsonl') if '"nonograms"' in line][:6]
+
+def unpresolved(monkeypatch):
+    monkeypatch.setattr(Nonograms, 'presolve', lambda self: (np.full((self.n, self.m), -1), {'row': {}, 'col': {}}))
+
+@pytest.mark.parametrize('input', ['example/nonograms.txt'] + TASKS)
+def test_presolve_matches_default(monkeypatch, input):
+    presolved = Nonograms(input, backend='cpsat')
+    grid, bounds = presolved.presolve()
+    solution = presolved.solution_array()
+    assert np.all((grid == -1) | (grid == solution))
+    assert presolved.fixed == np.count_nonzero(grid != -1)
+    unpresolved(monkeypatch)
+    assert str(Nonograms(input, backend='cpsat')) == str(presolved)
+
+def test_presolve_keeps_every_solution(monkeypatch):
+    # two diagonals fit the clues, no cell can be fixed
+    task = '1/1/1/1'
+    puzzle = Nonograms(task)
+    assert puzzle.fixed == 0
+    assert puzzle.count_solutions(3) == 2
+    unpresolved(monkeypatch)
+    assert Nonograms(task).count_solutions(3) == 2
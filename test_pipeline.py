@@ -0,0 +1,57 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import pytest
+import online
+from pipeline import Pipeline
+from sudoku import Sudoku
+
+TASK = 'd3b3a6a1c3f1a3_2b6a4b1b'
+
+class Site(BaseHTTPRequestHandler):
+    '''
+    A stand-in of the puzzle site: a post without an answer fetches the task, one with ansH submits it
+    '''
+    def do_POST(self):
+        data = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode(), keep_blank_values=True).items()}
+        self.server.posts.append((self.path, data))
+        if self.path == '/hallsubmit.php':
+            body = 'ok'
+        elif 'ansH' in data:
+            body = '<div id="ajaxResponse"><p class="succeed">Congratulations!</p></div><input name="solparams" value="sol">'
+        else:
+            body = f"var task = '{self.server.task}'; <input name=\"param\" value=\"param\">"
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def site(monkeypatch):
+    monkeypatch.setattr(online, 'token', lambda: 'token')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Site)
+    server.posts = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_round(site):
+    site.task = TASK
+    url = f'http://127.0.0.1:{site.server_port}/'
+    assert Pipeline(url, Sudoku, prefetch=1, workers=1).run(1) == ['Congratulations! (submit to hall successfully)']
+    paths = [path for path, data in site.posts]
+    assert paths == ['/', '/', '/hallsubmit.php']
+    assert site.posts[1][1]['ansH'] == str(Sudoku(TASK))
+    assert site.posts[2][1]['solparams'] == 'sol'
+
+def test_solver_error(site):
+    site.task = TASK + 'a'
+    url = f'http://127.0.0.1:{site.server_port}/'
+    responses = Pipeline(url, Sudoku, prefetch=1, workers=1).run(1)
+    assert responses[0].startswith('Error: ')
+    assert [data for path, data in site.posts if 'ansH' in data or path == '/hallsubmit.php'] == []
@@ -0,0 +1,25 @@
+import warnings
+import pytest
+from skyscrapers import Skyscrapers
+from sudoku import Sudoku
+
+def test_pool_search():
+    puzzle = Sudoku('example/sudoku.txt', params={'OutputFlag': 0})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert len(list(puzzle.iter_solutions(limit=2))) == 1
+    assert puzzle.stats['enumeration'] == 'pool'
+
+def test_general_constraints_warn_on_fallback():
+    puzzle = Skyscrapers('example/skyscrapers.txt', params={'OutputFlag': 0})
+    assert puzzle.model.NumGenConstrs > 0
+    with pytest.warns(UserWarning, match='nogood re-solves'):
+        assert len(list(puzzle.iter_solutions(limit=2))) == 1
+    assert puzzle.stats['enumeration'] == 'nogood'
+
+def test_pool_search_keeps_params():
+    puzzle = Skyscrapers('example/skyscrapers.txt', params={'OutputFlag': 0, 'WorkLimit': 100, 'PoolSolutions': 3})
+    with pytest.warns(UserWarning):
+        list(puzzle.iter_solutions(limit=2))
+    assert puzzle.model.getParamInfo('WorkLimit')[2] == 100
+    assert puzzle.model.getParamInfo('PoolSolutions')[2] == 3
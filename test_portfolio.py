@@ -0,0 +1,53 @@
+import threading
+import time
+import scheduler
+from backend import CpSat
+from scheduler import Scheduler
+from sudoku import Sudoku
+
+TASK = 'd3b3a6a1c3f1a3_2b6a4b1b'
+
+class Race(Sudoku):
+    def strategy_bank(self):
+        return {'default': self.strategy_default, 'inequality': self.strategy_inequality}
+
+def test_racers_run_at_the_same_time(monkeypatch):
+    # a single core budget, racers reserving it one by one would never meet at the barrier
+    monkeypatch.setattr(scheduler, 'scheduler', Scheduler(1))
+    barrier = threading.Barrier(2, timeout=10)
+    optimize = CpSat.optimize
+    def meet(self):
+        barrier.wait()
+        optimize(self)
+    monkeypatch.setattr(CpSat, 'optimize', meet)
+    puzzle = Race(TASK, strategy='portfolio', backend='cpsat')
+    assert puzzle.status() == 'solved'
+    assert puzzle.stats['portfolio'] in ['default', 'inequality']
+    assert puzzle.stats['threads'] == 1
+
+class Held(Sudoku):
+    release = threading.Event()
+
+    def strategy_held(self):
+        # a native racer which cannot be terminated
+        self.native = True
+        self.solutions = []
+        self.release.wait(10)
+
+    def strategy_bank(self):
+        return {'default': self.strategy_default, 'held': self.strategy_held}
+
+def wait_free(budget, value):
+    deadline = time.perf_counter() + 10
+    while budget.free.value != value and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return budget.free.value
+
+def test_native_racer_holds_its_part(monkeypatch):
+    budget = Scheduler(2)
+    monkeypatch.setattr(scheduler, 'scheduler', budget)
+    puzzle = Held(TASK, strategy='portfolio', params={'OutputFlag': 0})
+    assert puzzle.stats['portfolio'] == 'default'
+    assert wait_free(budget, 1) == 1
+    Held.release.set()
+    assert wait_free(budget, 2) == 2
@@ -0,0 +1,23 @@
+import gurobipy as gp
+from backend import CpSat
+from scheduler import Scheduler
+
+def test_gurobi_threads_follow_size():
+    scheduler = Scheduler(4)
+    model = gp.Model()
+    model.addVars(10)
+    with scheduler.reserve(model) as threads:
+        assert threads == 1
+        assert model.getParamInfo('Threads')[2] == 1
+    model.dispose()
+
+def test_cpsat_keeps_its_workers():
+    scheduler = Scheduler(4)
+    model = CpSat('test')
+    model.addVars(10, vtype=gp.GRB.BINARY)
+    with scheduler.reserve(model) as threads:
+        assert threads == 4
+        assert 'Threads' not in model.parameters
+    with scheduler.reserve(model, 2) as threads:
+        assert threads == 2
+        assert model.parameters['Threads'] == 2